@@ -0,0 +1,250 @@
+"""End-to-end benchmark of the pipeline stages against local fixtures.
+
+Prompt pages and an infinite-scroll gallery are served by a local fixture site and Gemini
+requests are answered by StubGemini, so no network access or API key is needed. Each stage
+runs in its own process and reports prompts/sec, p50/p95 latency, peak RSS and API calls per
+prompt. Latency is measured per page for scraping, per prompt for formatting and per Gemini
+request for variations and metadata. The gallery and pipeline stages scroll the gallery in
+Chrome; the others only need it with --engine selenium.
+
+Usage:
+  python benchmarks/bench_pipeline.py --prompts 500 --output results.json
+  python benchmarks/bench_pipeline.py --stages metadata --rate-429 0.1 --malformed-rate 0.05 --compare results.json
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import PromptPipeline, SCRAPE_ENGINE_HTTP, SCRAPE_ENGINE_SELENIUM
+from fixture_server import FixtureServer, prompt_text
+from gemini_stub import StubGemini
+
+STAGES = ["gallery", "scrape", "format", "variations", "metadata", "pipeline"]
+DEFAULT_STAGES = ["scrape", "format", "variations", "metadata"]
+ENGINES = {"http": SCRAPE_ENGINE_HTTP, "selenium": SCRAPE_ENGINE_SELENIUM}
+FILE_PREFIX = "Bench"
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def latency_summary(values):
+    return {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def timed(function, latencies):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+    return wrapper
+
+
+def metadata_rows(file_prefix):
+    with open(f"{file_prefix}-md-V1.csv", newline="", encoding="utf-8") as file:
+        return sum(1 for _ in csv.reader(file, delimiter=";")) - 1
+
+
+def run_stage(stage, args):
+    # Runs one stage in this process and returns its measurements
+    stub = StubGemini(latency=args.latency, rate_429=args.rate_429, malformed_rate=args.malformed_rate, seed=args.seed)
+
+    class BenchPipeline(PromptPipeline):
+        def create_scheduler(self, api_keys):
+            from gemini_client import GeminiScheduler
+            return GeminiScheduler(api_keys, model_factory=stub.model_factory, requests_per_minute=args.rpm, tokens_per_minute=10 ** 9,
+                                   telemetry=self.telemetry)
+
+    pipeline = BenchPipeline(prompt_index_file=None)
+    api_keys = [f"bench-key-{n + 1}" for n in range(args.keys)]
+    prompts = [prompt_text(index) for index in range(args.prompts)]
+    page_latencies = []
+    latencies = {}
+    pipeline.fetch_content_from_link = timed(pipeline.fetch_content_from_link, page_latencies)
+    pipeline.scrape_content_from_link = timed(pipeline.scrape_content_from_link, page_latencies)
+    max_attempts = math.ceil(args.prompts / args.page_size) + 2
+
+    server = FixtureServer(num_prompts=args.prompts, page_delay=args.page_delay, page_size=args.page_size, scroll_delay=args.scroll_delay)
+    try:
+        with server:
+            started = time.perf_counter()
+            if stage == "gallery":
+                scroll_latencies = []
+                pipeline.wait_for_scroll = timed(pipeline.wait_for_scroll, scroll_latencies)
+                count = len(pipeline.scrape_initial_links(server.gallery_url, max_attempts))
+                latencies["scroll"] = latency_summary(scroll_latencies)
+            elif stage == "scrape":
+                count = len(pipeline.scrape_content_from_links(server.prompt_links(), num_workers=args.workers, scrape_engine=ENGINES[args.engine]))
+                latencies["page"] = latency_summary(page_latencies)
+            elif stage == "format":
+                prompt_latencies = []
+                formatted = pipeline.write_formatted_content(pipeline.format_prompts(prompts, 1, FILE_PREFIX), "prompts.csv")
+                while True:
+                    item_started = time.perf_counter()
+                    if next(formatted, None) is None:
+                        break
+                    prompt_latencies.append(time.perf_counter() - item_started)
+                count = len(prompts)
+                latencies["prompt"] = latency_summary(prompt_latencies)
+            elif stage == "variations":
+                pipeline.generate_variations(prompts, pipeline.create_scheduler(api_keys))
+                count = len(prompts)
+                latencies["request"] = latency_summary(stub.latencies)
+            elif stage == "metadata":
+                formatted = ((f"{index + 1}_{prompt}", f"{FILE_PREFIX}V1-{index + 1}.jpg") for index, prompt in enumerate(prompts))
+                pipeline.generate_metadata(formatted, pipeline.create_scheduler(api_keys), FILE_PREFIX, total_prompts=len(prompts))
+                count = metadata_rows(FILE_PREFIX)
+                latencies["request"] = latency_summary(stub.latencies)
+            else:
+                pipeline.run(server.gallery_url, "prompts.csv", 1, max_attempts, FILE_PREFIX, api_keys, args.workers,
+                             ENGINES[args.engine], generate_variations=args.variations)
+                count = metadata_rows(FILE_PREFIX)
+                latencies["page"] = latency_summary(page_latencies)
+                latencies["request"] = latency_summary(stub.latencies)
+            elapsed = time.perf_counter() - started
+    finally:
+        pipeline.close()
+
+    return {
+        "prompts": count,
+        "seconds": elapsed,
+        "prompts_per_second": count / elapsed if elapsed else None,
+        "latency": latencies,
+        "peak_rss_mb": peak_rss_mb(),
+        "api_calls": stub.calls,
+        "api_calls_per_prompt": stub.calls / count if count else None,
+        "throttled": stub.throttled,
+        "malformed": stub.malformed,
+    }
+
+
+def run_child(stage):
+    # Every stage gets a fresh process, for a clean peak RSS, and a scratch directory for its files
+    with tempfile.TemporaryDirectory(prefix=f"bench-{stage}-") as work_dir:
+        command = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ["--child", stage]
+        result = subprocess.run(command, cwd=work_dir, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}"}
+    return json.loads(lines[-1])
+
+
+def format_value(value, pattern):
+    return "-" if value is None else format(value, pattern)
+
+
+def print_results(stages):
+    print(f"{'stage':>10} {'prompts':>8} {'seconds':>8} {'prompts/s':>10} {'latency':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>7} {'calls/prompt':>12}")
+    for stage, result in stages.items():
+        if "error" in result:
+            print(f"{stage:>10} failed: {result['error']}")
+            continue
+        for n, (name, latency) in enumerate(result["latency"].items()):
+            p50 = latency["p50"] * 1000 if latency["p50"] is not None else None
+            p95 = latency["p95"] * 1000 if latency["p95"] is not None else None
+            if n:
+                print(f"{'':>10} {'':>8} {'':>8} {'':>10} {name:>8} {format_value(p50, '.1f'):>8} {format_value(p95, '.1f'):>8}")
+                continue
+            print(
+                f"{stage:>10} {result['prompts']:>8} {result['seconds']:>8.2f} {format_value(result['prompts_per_second'], '.1f'):>10} "
+                f"{name:>8} {format_value(p50, '.1f'):>8} {format_value(p95, '.1f'):>8} {format_value(result['peak_rss_mb'], '.0f'):>7} "
+                f"{format_value(result['api_calls_per_prompt'], '.3f'):>12}"
+            )
+
+
+def print_comparison(stages, baseline_file):
+    with open(baseline_file, "r", encoding="utf-8") as file:
+        baseline = json.load(file)["stages"]
+    print(f"\nCompared with {baseline_file}:")
+    for stage, result in stages.items():
+        old = baseline.get(stage)
+        if old is None or "error" in old or "error" in result or not old["prompts_per_second"]:
+            continue
+        change = result["prompts_per_second"] / old["prompts_per_second"] - 1
+        line = f"{stage:>10} prompts/s {old['prompts_per_second']:.1f} -> {result['prompts_per_second']:.1f} ({change:+.1%})"
+        for name, latency in result["latency"].items():
+            old_latency = old["latency"].get(name)
+            if old_latency and old_latency["p95"] and latency["p95"] is not None:
+                line += f", {name} p95 {old_latency['p95'] * 1000:.1f} -> {latency['p95'] * 1000:.1f} ms"
+        if old.get("peak_rss_mb") and result.get("peak_rss_mb"):
+            line += f", RSS {old['peak_rss_mb']:.0f} -> {result['peak_rss_mb']:.0f} MB"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=DEFAULT_STAGES, help="stages to benchmark")
+    parser.add_argument("--prompts", type=int, default=300, help="prompt pages in the fixture gallery and prompts per stage")
+    parser.add_argument("--page-delay", type=float, default=0.05, help="server-side delay per prompt page in seconds")
+    parser.add_argument("--page-size", type=int, default=50, help="gallery cards loaded per infinite-scroll step")
+    parser.add_argument("--scroll-delay", type=float, default=0.2, help="server-side delay per infinite-scroll request in seconds")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="http", help="scrape engine")
+    parser.add_argument("--workers", type=int, default=4, help="scraping workers")
+    parser.add_argument("--variations", action="store_true", help="generate variations in the pipeline stage")
+    parser.add_argument("--keys", type=int, default=2, help="stub API keys")
+    parser.add_argument("--rpm", type=int, default=600, help="requests per minute allowed per stub key")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub Gemini latency per request in seconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of stub requests answered with 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of stub answers that are damaged")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the stub's random choices")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--child", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_stage(args.child, args)))
+        return
+
+    stages = {}
+    for stage in args.stages:
+        print(f"Running {stage}...", file=sys.stderr)
+        stages[stage] = run_child(stage)
+    print_results(stages)
+    if args.compare:
+        print_comparison(stages, args.compare)
+    if args.output:
+        settings = {name: value for name, value in vars(args).items() if name not in ("output", "compare", "child")}
+        results = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": settings,
+            "stages": stages,
+        }
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
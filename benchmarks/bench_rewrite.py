@@ -0,0 +1,90 @@
+"""Benchmark the prompt rewrite rules on a synthetic corpus.
+
+Compares the old two-call "--v" rewrite with RewriteRules holding only the "--v" rule, then
+one compiled pass per rule with the combined single-pass scanner on a larger rule set.
+
+Usage: python benchmarks/bench_rewrite.py --prompts 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rewrite_rules import RewriteRules, DEFAULT_RULES
+
+BENCH_RULES = DEFAULT_RULES + [
+    {"name": "aspect ratio", "parameter": "ar", "value_pattern": r"\d+:\d+", "set": "16:9"},
+    {"name": "style", "parameter": "style", "remove": True},
+    {"name": "banned terms", "terms": ["trending on artstation", "unreal engine", "octane render", "greg rutkowski"]},
+]
+SUBJECTS = ["a red fox", "an old lighthouse", "a quiet harbour", "a neon city street", "a bowl of ramen", "a snowy forest"]
+DETAILS = ["at dawn", "in heavy rain", "soft light", "highly detailed", "cinematic lighting", "watercolor", "isometric view"]
+EXTRAS = ["trending on artstation", "unreal engine", "octane render", "by greg rutkowski", "8k", "bokeh"]
+PARAMETERS = ["--ar 16:9", "--ar 2:3", "--v 5.2", "--v 6", "--v 6.1", "--style raw", "--q 2", "--stylize 250", "--chaos 10"]
+
+
+def synthetic_prompts(count, seed=0):
+    rng = random.Random(seed)
+    prompts = []
+    for _ in range(count):
+        words = [rng.choice(SUBJECTS)] + rng.sample(DETAILS, rng.randint(1, 4)) + rng.sample(EXTRAS, rng.randint(0, 2))
+        prompts.append(", ".join(words) + " " + " ".join(rng.sample(PARAMETERS, rng.randint(0, 3))))
+    return prompts
+
+
+def legacy_rewrite(prompt):
+    # The rewrite format_content used before the rules engine
+    original_v_value = re.search(r'--v (\d+(?:\.\d+)?)', prompt)
+    updated_prompt = re.sub(r'--v (\d+(?:\.\d+)?)', '--v 6.1', prompt)
+    return updated_prompt, original_v_value
+
+
+def per_rule_rewriter():
+    # Every rule compiled on its own, one pass over the prompt per rule
+    engines = [RewriteRules([rule]) for rule in BENCH_RULES]
+
+    def rewrite(prompt):
+        for engine in engines:
+            prompt = engine.rewrite(prompt)[0]
+        return prompt
+    return rewrite
+
+
+def timed(name, rewrite, corpus, total):
+    started = time.perf_counter()
+    for prompt in itertools.islice(corpus(), total):
+        rewrite(prompt)
+    elapsed = time.perf_counter() - started
+    print(f"{name:>22} {elapsed:>9.2f} {elapsed / total * 1e6:>12.2f} {total / elapsed:>12.0f}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=1000000, help="number of prompts to rewrite per variant")
+    parser.add_argument("--distinct", type=int, default=20000, help="distinct synthetic prompts, cycled to reach --prompts")
+    args = parser.parse_args()
+
+    pool = synthetic_prompts(args.distinct)
+
+    def corpus():
+        return itertools.cycle(pool)
+
+    rules = RewriteRules(BENCH_RULES)
+    print(f"{args.prompts} prompts, {len(BENCH_RULES)} rules for the rule engine variants")
+    print(f"{'variant':>22} {'seconds':>9} {'us/prompt':>12} {'prompts/s':>12}")
+    timed("legacy --v only", legacy_rewrite, corpus, args.prompts)
+    timed("scanner, --v only", RewriteRules(DEFAULT_RULES).rewrite, corpus, args.prompts)
+    timed("one pass per rule", per_rule_rewriter(), corpus, args.prompts)
+    timed("single-pass scanner", rules.rewrite, corpus, args.prompts)
+    for line in rules.stats_lines():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
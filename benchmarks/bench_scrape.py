@@ -0,0 +1,52 @@
+"""Benchmark scrape_content_from_links against a local fixture site.
+
+Usage: python benchmarks/bench_scrape.py --prompts 40 --workers 1 2 4 8 --engine http selenium
+
+Browsers stay warm in the driver pool between the compared configurations, so only the
+first browser run pays for launching them; the pool's launch count is printed at the end.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import PromptPipeline, SCRAPE_ENGINE_HTTP, SCRAPE_ENGINE_SELENIUM
+from fixture_server import FixtureServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=40, help="number of prompt pages served by the fixture site")
+    parser.add_argument("--page-delay", type=float, default=0.5, help="server-side delay per prompt page in seconds")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument("--engine", nargs="+", choices=["http", "selenium"], default=["selenium"], help="scrape engines to compare")
+    parser.add_argument("--js-every", type=int, default=0, help="render #editorEl with JavaScript on every Nth page to force the browser fallback")
+    parser.add_argument("--verbose", action="store_true", help="print scraper log messages")
+    args = parser.parse_args()
+
+    scraper = PromptPipeline(log=print if args.verbose else None)
+    engines = {"http": SCRAPE_ENGINE_HTTP, "selenium": SCRAPE_ENGINE_SELENIUM}
+    with FixtureServer(num_prompts=args.prompts, page_delay=args.page_delay, js_every=args.js_every) as server:
+        links = server.prompt_links()
+        baseline = None
+        print(f"{'engine':>9} {'workers':>8} {'seconds':>10} {'pages/s':>10} {'speedup':>8}")
+        for engine in args.engine:
+            for num_workers in args.workers:
+                started = time.perf_counter()
+                content = scraper.scrape_content_from_links(links, num_workers=num_workers, scrape_engine=engines[engine])
+                elapsed = time.perf_counter() - started
+                if len(content) != len(links):
+                    print(f"warning: extracted {len(content)} paragraphs from {len(links)} pages")
+                if baseline is None:
+                    baseline = elapsed
+                print(f"{engine:>9} {num_workers:>8} {elapsed:>10.2f} {len(links) / elapsed:>10.2f} {baseline / elapsed:>7.2f}x")
+        for line in scraper.wait_stats.summary_lines():
+            print(line)
+        print(scraper.driver_pool.stats_line())
+    scraper.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import html
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUBJECTS = ["A quiet harbour", "An old lighthouse", "A red fox", "A neon city street", "A snowy forest", "A bowl of ramen"]
+DETAILS = ["at dawn", "in heavy rain", "soft light", "cinematic lighting", "watercolor", "isometric view", "highly detailed"]
+# Made-up words keep the prompts of different pages far apart for the near-duplicate check
+WORDS = [first + second for first in ("ka", "lo", "mi", "ra", "su", "te", "vo", "ne") for second in ("ber", "dan", "fis", "gol", "mar", "pen", "sol", "tir")]
+
+
+def prompt_text(index):
+    rng = random.Random(index)
+    words = ", ".join(rng.sample(WORDS, 6))
+    return f"{rng.choice(SUBJECTS)} {rng.choice(DETAILS)}, {words}, variation {index} --ar 16:9 --v 5.2"
+
+
+class FixtureRequestHandler(BaseHTTPRequestHandler):
+    # Set on the server instance by FixtureServer
+    # server.page_delay: seconds to wait before answering a prompt page, simulating a slow site
+    # server.js_every: every Nth prompt page builds #editorEl with JavaScript (0 disables)
+    # server.page_size: cards on the gallery page and per infinite-scroll request (0 shows all at once)
+    # server.scroll_delay: seconds to wait before answering an infinite-scroll request
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path.startswith("/prompt/"):
+            try:
+                index = int(path[len("/prompt/"):])
+            except ValueError:
+                self.send_error(404)
+                return
+            time.sleep(self.server.page_delay)
+            self.send_html(self.prompt_page(index))
+        elif path == "/gallery":
+            self.send_html(self.gallery_page())
+        elif path == "/gallery/cards":
+            # The next page of cards for the infinite scroll, as a JSON list of links
+            try:
+                offset = int(query.partition("offset=")[2].split("&")[0])
+            except ValueError:
+                self.send_error(400)
+                return
+            time.sleep(self.server.scroll_delay)
+            end = min(self.server.num_prompts, offset + self.server.page_size)
+            self.send_body(json.dumps([f"/prompt/{index}" for index in range(offset, end)]), "application/json")
+        else:
+            self.send_error(404)
+
+    def prompt_page(self, index):
+        text = html.escape(prompt_text(index))
+        if self.server.js_every and index % self.server.js_every == 0:
+            return f"""<!DOCTYPE html>
+<html><head><title>Prompt {index}</title></head>
+<body>
+<div id="app"></div>
+<script>
+var editor = document.createElement("div");
+editor.id = "editorEl";
+var p = document.createElement("p");
+p.textContent = {json.dumps(prompt_text(index))};
+editor.appendChild(p);
+document.getElementById("app").appendChild(editor);
+</script>
+</body></html>"""
+        return f"""<!DOCTYPE html>
+<html><head><title>Prompt {index}</title></head>
+<body>
+<div id="editorEl"><p>{text}</p></div>
+</body></html>"""
+
+    def gallery_page(self):
+        first_page = self.server.page_size or self.server.num_prompts
+        cards = "\n".join(
+            f'<a class="prompt-card" href="/prompt/{index}">Prompt {index}</a>'
+            for index in range(min(first_page, self.server.num_prompts))
+        )
+        return f"""<!DOCTYPE html>
+<html><head><style>.prompt-card {{ display: block; height: 120px; }}</style></head>
+<body>
+<div id="grid">{cards}</div>
+<script>
+var offset = {first_page}, total = {self.server.num_prompts}, loading = false;
+window.addEventListener("scroll", function () {{
+    if (loading || offset >= total || window.innerHeight + window.scrollY < document.body.scrollHeight - 200) return;
+    loading = true;
+    fetch("/gallery/cards?offset=" + offset).then(function (response) {{ return response.json(); }}).then(function (hrefs) {{
+        var grid = document.getElementById("grid");
+        hrefs.forEach(function (href) {{
+            var card = document.createElement("a");
+            card.className = "prompt-card";
+            card.href = href;
+            card.textContent = href;
+            grid.appendChild(card);
+        }});
+        offset += hrefs.length;
+        loading = false;
+    }});
+}});
+</script>
+</body></html>"""
+
+    def send_html(self, body):
+        self.send_body(body, "text/html")
+
+    def send_body(self, body, content_type):
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """Local HTTP server serving an infinite-scroll gallery page and `#editorEl` prompt pages."""
+
+    def __init__(self, num_prompts=50, page_delay=0.5, js_every=0, page_size=0, scroll_delay=0.2, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), FixtureRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.num_prompts = num_prompts
+        self.httpd.page_delay = page_delay
+        self.httpd.js_every = js_every
+        self.httpd.page_size = page_size
+        self.httpd.scroll_delay = scroll_delay
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def gallery_url(self):
+        return f"{self.base_url}/gallery"
+
+    def prompt_links(self):
+        return [f"{self.base_url}/prompt/{index}" for index in range(self.httpd.num_prompts)]
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
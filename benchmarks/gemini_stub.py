@@ -0,0 +1,99 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+from google.api_core import exceptions
+
+
+class StubChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubGemini:
+    """Stand-in for the Gemini API with configurable latency, 429 rate and malformed-response rate.
+
+    Pass `model_factory` to GeminiScheduler. Each request waits `latency` seconds (with up to
+    `jitter` relative spread), fails with a 429 with probability `rate_429`, and otherwise streams
+    a JSON answer for every prompt in the request. With probability `malformed_rate` the answer
+    is damaged: a record is dropped, one is broken, or the text is cut off.
+    """
+
+    def __init__(self, latency=0.5, jitter=0.3, rate_429=0.0, malformed_rate=0.0, chunk_size=64, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.malformed_rate = malformed_rate
+        self.chunk_size = chunk_size
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self.malformed = 0
+        self.latencies = []
+
+    def model_factory(self, api_key, model_name, generation_config):
+        return StubModel(self)
+
+    def answer(self, prompt):
+        items = []
+        for line in prompt.split("Here are the prompts:", 1)[-1].splitlines():
+            line = line.strip()
+            if line.startswith("{"):
+                items.append(json.loads(line))
+        if '"keywords"' in prompt:
+            records = [{
+                "id": item["id"],
+                "title": " ".join(item["prompt"].split()[:4]),
+                "keywords": [f"keyword{n}" for n in range(30)],
+                "prompt": " ".join(item["prompt"].split()[:10]),
+                "model": "Midjourney 6",
+            } for item in items]
+        else:
+            records = [{
+                "id": item["id"],
+                "prompt": item["prompt"],
+                "variations": [f"{item['prompt']}, take {n + 1}" for n in range(4)],
+            } for item in items]
+
+        with self.lock:
+            malformed = self.rng.random() < self.malformed_rate
+            damage = self.rng.choice(["drop", "break", "truncate"])
+        if not malformed or not records:
+            return json.dumps(records)
+        self.malformed += 1
+        if damage == "drop":
+            records.pop(len(records) // 2)
+            return json.dumps(records)
+        text = json.dumps(records)
+        if damage == "break":
+            return text.replace('"id"', '"id" "', 1)
+        return text[:len(text) * 2 // 3]
+
+
+class StubModel:
+    def __init__(self, stub):
+        self.stub = stub
+
+    async def generate_content_async(self, prompt, stream=False):
+        stub = self.stub
+        started = time.monotonic()
+        with stub.lock:
+            stub.calls += 1
+            delay = stub.latency * (1 + stub.jitter * (2 * stub.rng.random() - 1))
+            throttled = stub.rng.random() < stub.rate_429
+        await asyncio.sleep(max(0.0, delay))
+        if throttled:
+            stub.throttled += 1
+            stub.latencies.append(time.monotonic() - started)
+            raise exceptions.TooManyRequests("Resource has been exhausted (stub)")
+        text = stub.answer(prompt)
+
+        async def chunks():
+            for start in range(0, len(text), stub.chunk_size):
+                yield StubChunk(text[start:start + stub.chunk_size])
+                await asyncio.sleep(0)
+            stub.latencies.append(time.monotonic() - started)
+        return chunks()
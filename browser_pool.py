@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+
+DRIVER_PATH_FILE = "chromedriver_path.json"
+DRIVER_PATH_TTL = 24 * 3600  # Ask webdriver_manager for a newer driver once a day
+# Page resources the scraper never needs, blocked through the DevTools protocol
+BLOCKED_URL_PATTERNS = [
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico", "*.mp4", "*.webm",
+]
+# The gallery keeps its stylesheets, its infinite scroll depends on the card layout
+GALLERY_BLOCKED_URL_PATTERNS = [pattern for pattern in BLOCKED_URL_PATTERNS if pattern != "*.css"]
+BLOCKED_CONTENT_PREFERENCES = {"profile.managed_default_content_settings.images": 2}
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def resolve_driver_path(cache_file=DRIVER_PATH_FILE, ttl=DRIVER_PATH_TTL):
+    """Return the chromedriver path, resolved at most once per process.
+
+    ChromeDriverManager().install() may check online for a newer driver, so the path it
+    returns is also kept in `cache_file` and reused by later runs for `ttl` seconds, as
+    long as the binary still exists.
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is not None and os.path.exists(_driver_path):
+            return _driver_path
+        try:
+            with open(cache_file, "r", encoding="utf-8") as file:
+                cached = json.load(file)
+            if time.time() - cached["resolved_at"] < ttl and os.path.exists(cached["path"]):
+                _driver_path = cached["path"]
+                return _driver_path
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        from webdriver_manager.chrome import ChromeDriverManager
+        _driver_path = ChromeDriverManager().install()
+        try:
+            with open(cache_file, "w", encoding="utf-8") as file:
+                json.dump({"path": _driver_path, "resolved_at": time.time()}, file)
+        except OSError:
+            pass
+        return _driver_path
+
+
+def block_resources(driver, patterns=BLOCKED_URL_PATTERNS):
+    # Stylesheets, fonts and media are cancelled before they are requested
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+
+class DriverPool:
+    """Keeps launched browsers warm so they are reused across stages and runs.
+
+    `launch()` must return a new WebDriver. `acquire` hands out an idle driver, or launches
+    one if none is free, and `release` gives it back. A driver is quit and replaced on the next
+    `acquire` once it has loaded `max_pages` pages, which bounds the memory a long-lived Chrome
+    accumulates. Idle drivers that stopped responding are replaced as well. Thread-safe.
+    """
+
+    def __init__(self, launch, max_pages=200):
+        self.launch = launch
+        self.max_pages = max_pages
+        self.lock = threading.Lock()
+        # Chrome start-up is CPU heavy and webdriver_manager is not safe to run concurrently
+        self.launch_lock = threading.Lock()
+        self.idle = []
+        self.pages = {}
+        self.launches = 0
+        self.recycled = 0
+        self.page_loads = 0
+        self.page_load_time = 0.0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                driver = self.idle.pop() if self.idle else None
+            if driver is None:
+                break
+            if self._alive(driver):
+                return driver
+            self._quit(driver)
+
+        with self.launch_lock:
+            driver = self.launch()
+        with self.lock:
+            self.launches += 1
+            self.pages[driver] = 0
+        return driver
+
+    def release(self, driver):
+        with self.lock:
+            if self.pages.get(driver, 0) < self.max_pages:
+                self.idle.append(driver)
+                return
+            self.recycled += 1
+        self._quit(driver)
+
+    def discard(self, driver):
+        """Quit a driver that should not be handed out again."""
+        self._quit(driver)
+
+    def record_page_load(self, driver, seconds):
+        with self.lock:
+            self.pages[driver] = self.pages.get(driver, 0) + 1
+            self.page_loads += 1
+            self.page_load_time += seconds
+
+    def trim(self, keep=1):
+        """Quit all but `keep` idle drivers, the rest would only hold memory between runs."""
+        with self.lock:
+            surplus = self.idle[keep:]
+            del self.idle[keep:]
+        for driver in surplus:
+            self._quit(driver)
+
+    def stats_line(self):
+        with self.lock:
+            average = self.page_load_time / self.page_loads if self.page_loads else 0
+            return (
+                f"Browser pool: {self.launches} launches, {self.recycled} recycled after {self.max_pages} pages, "
+                f"{self.page_loads} page loads, {average:.2f}s average page load, {len(self.idle)} kept warm"
+            )
+
+    def close(self):
+        self.trim(0)
+
+    def _alive(self, driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _quit(self, driver):
+        with self.lock:
+            self.pages.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class DiskCache:
+    """Persistent key/value cache in a SQLite file with a TTL and an LRU size cap.
+
+    Values are stored as JSON. Entries older than `ttl` seconds are treated as misses and
+    removed; once more than `max_entries` are stored the least recently used ones are evicted.
+    One instance can be shared between threads.
+    """
+
+    def __init__(self, path, ttl=14 * 24 * 3600, max_entries=200000, table="entries"):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)")
+        self.connection.commit()
+        self.entry_count = self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss or an expired entry."""
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self.connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.connection.commit()
+                self.entry_count -= 1
+                self.misses += 1
+                return None
+            self.connection.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, key, value):
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self.lock:
+            existed = self.connection.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, data, now, now),
+            )
+            if not existed:
+                self.entry_count += 1
+            if self.max_entries is not None and self.entry_count > self.max_entries:
+                self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        # Drop expired entries first, then the least recently used down to 90% of the cap
+        # so eviction does not run again on every following put
+        if self.ttl is not None:
+            removed = self.connection.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            self.entry_count -= removed
+            self.evictions += removed
+        target = int(self.max_entries * 0.9)
+        if self.entry_count > target:
+            excess = self.entry_count - target
+            removed = self.connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)",
+                (excess,),
+            ).rowcount
+            self.entry_count -= removed
+            self.evictions += removed
+
+    def stats_line(self, name):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0
+        return (
+            f"{name}: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+            f"{self.entry_count} entries, {self.evictions} evicted"
+        )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class ResponseMemo:
+    """Memoizes model output per prompt in a DiskCache.
+
+    The key is a hash of the prompt text together with the instruction template, model
+    name and generation config, so changing any of them never returns a stale answer.
+    """
+
+    def __init__(self, cache, template, model_name, generation_config):
+        self.cache = cache
+        signature = json.dumps([template, model_name, sorted(generation_config.items())], ensure_ascii=False)
+        self.prefix = hashlib.sha256(signature.encode("utf-8")).hexdigest()
+
+    def key(self, prompt):
+        return hashlib.sha256(f"{self.prefix}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, prompt):
+        return self.cache.get(self.key(prompt))
+
+    def put(self, prompt, value):
+        self.cache.put(self.key(prompt), value)
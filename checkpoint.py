@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+DONE_MARKER = "_stage_done"
+PARAMS_FILE = "run.json"
+
+
+class StageCheckpoint:
+    """Append-only JSON-lines checkpoint for one pipeline stage.
+
+    Records are flushed on every append but only fsynced every `fsync_every` records or
+    `fsync_interval` seconds, so checkpointing stays cheap while a crash loses at most
+    one small batch. A truncated last line from a crash is ignored when loading.
+    `records` holds what was on disk when the checkpoint was opened; appended records
+    only go to the file, so long stages do not accumulate them in memory.
+    """
+
+    def __init__(self, path, fsync_every=20, fsync_interval=2.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.records, self.done = self._load()
+        self.file = None
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def _load(self):
+        records = []
+        done = False
+        if not os.path.exists(self.path):
+            return records, done
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and record.get(DONE_MARKER):
+                    done = True
+                else:
+                    records.append(record)
+        return records, done
+
+    def _open(self):
+        if self.file is None:
+            needs_newline = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+            if needs_newline:
+                with open(self.path, "rb") as file:
+                    file.seek(-1, os.SEEK_END)
+                    needs_newline = file.read(1) != b"\n"
+            self.file = open(self.path, "a", encoding="utf-8")
+            if needs_newline:
+                # Terminate a line cut off by a crash so the next record starts cleanly
+                self.file.write("\n")
+        return self.file
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            file = self._open()
+            file.write(line + "\n")
+            file.flush()
+            self.pending += 1
+            if self.pending >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def reset(self):
+        """Remove every record, for a stage that is redone from the start."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            open(self.path, "w", encoding="utf-8").close()
+            self.records = []
+            self.done = False
+            self.pending = 0
+
+    def mark_done(self):
+        with self.lock:
+            file = self._open()
+            file.write(json.dumps({DONE_MARKER: True}) + "\n")
+            file.flush()
+            self.done = True
+            self._sync()
+
+    def _sync(self):
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
+
+
+class RunCheckpoint:
+    """Run directory holding one StageCheckpoint per pipeline stage.
+
+    Without `resume` an existing directory is moved aside with a timestamp suffix,
+    so a new run never mixes with (or destroys) the checkpoints of an older one.
+    `params` are kept in run.json; resuming with different params raises ValueError
+    before any checkpoint is touched, since the old checkpoints belong to another job.
+    """
+
+    def __init__(self, run_dir, resume=False, params=None):
+        self.run_dir = run_dir
+        self.resume = resume
+        params_file = os.path.join(run_dir, PARAMS_FILE)
+        stored = None
+        if resume and params is not None:
+            stored = self._load_params(params_file)
+            if stored is not None:
+                self._check_params(stored, params)
+        if not resume and os.path.isdir(run_dir) and os.listdir(run_dir):
+            shutil.move(run_dir, f"{run_dir}.{time.strftime('%Y%m%d-%H%M%S')}")
+        os.makedirs(run_dir, exist_ok=True)
+        self.stages = {}
+        if params is not None and stored is None:
+            with open(params_file, "w", encoding="utf-8") as file:
+                json.dump(params, file, ensure_ascii=False, indent=2)
+
+    def _load_params(self, params_file):
+        try:
+            with open(params_file, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _check_params(self, stored, params):
+        # Compared after a JSON round trip, so values read back from run.json match their originals
+        params = json.loads(json.dumps(params))
+        changed = [
+            f"{name} {stored.get(name)!r} -> {params.get(name)!r}"
+            for name in sorted(set(stored) | set(params))
+            if stored.get(name) != params.get(name)
+        ]
+        if changed:
+            raise ValueError(
+                f"Cannot resume from {self.run_dir}, its checkpoints were made with other settings: {', '.join(changed)}. "
+                "Use the same settings or start without resume"
+            )
+
+    @staticmethod
+    def run_dir_for(base_dir, name):
+        return os.path.join(base_dir, re.sub(r"[^\w.-]+", "_", name) or "run")
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageCheckpoint(os.path.join(self.run_dir, f"{name}.jsonl"))
+        return self.stages[name]
+
+    def close(self):
+        for stage in self.stages.values():
+            stage.close()
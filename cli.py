@@ -0,0 +1,92 @@
+"""Run the prompt pipeline without the GUI.
+
+Usage:
+  python cli.py all --url URL --file-name prompts.csv --start-number 1 --file-prefix Gate --api-keys KEY1,KEY2
+  python cli.py format --input raw_prompts.txt --file-name prompts.csv --start-number 1 --file-prefix Gate
+  python cli.py metadata --input prompts.csv --file-prefix Gate --api-keys KEY1,KEY2
+
+API keys can also be given in the GEMINI_API_KEYS environment variable.
+"""
+import argparse
+import os
+import sys
+
+from pipeline import (
+    PromptPipeline, parse_api_keys, setup_logging,
+    DEFAULT_MAX_ATTEMPTS, DEFAULT_SCRAPE_WORKERS, SCRAPE_ENGINE_HTTP, SCRAPE_ENGINE_SELENIUM,
+    NEAR_DUPLICATE_THRESHOLD, PROMPT_INDEX_FILE, REWRITE_RULES_FILE,
+)
+
+ENGINES = {"http": SCRAPE_ENGINE_HTTP, "selenium": SCRAPE_ENGINE_SELENIUM}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["all", "format", "metadata"], help="run every stage, only formatting, or only metadata")
+    parser.add_argument("--url", help="gallery URL to scrape (mode all)")
+    parser.add_argument("--input", help="raw prompts (mode format) or a formatted prompt CSV (mode metadata)")
+    parser.add_argument("--file-name", help="output CSV for the formatted prompts")
+    parser.add_argument("--start-number", type=int, default=1, help="serial number of the first prompt")
+    parser.add_argument("--file-prefix", required=True, help="image file name prefix, also names the run directory")
+    parser.add_argument("--api-keys", default=os.environ.get("GEMINI_API_KEYS", ""), help="Gemini API keys separated by commas")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="gallery scrolls before link collection stops")
+    parser.add_argument("--workers", type=int, default=DEFAULT_SCRAPE_WORKERS, help="number of scraping workers")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="http", help="fetch pages over HTTP with browser fallback, or only with the browser")
+    parser.add_argument("--variations", action="store_true", help="generate variations of every scraped prompt")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoints of an interrupted run")
+    parser.add_argument("--similarity", type=float, default=NEAR_DUPLICATE_THRESHOLD, help="drop prompts at least this similar (0-1) to an earlier one, 0 only drops exact duplicates")
+    parser.add_argument("--prompt-history", default=PROMPT_INDEX_FILE, help="file with the prompts of earlier runs to deduplicate against")
+    parser.add_argument("--no-history", action="store_true", help="only deduplicate within this run")
+    parser.add_argument("--rules", default=REWRITE_RULES_FILE, help="JSON file with the prompt rewrite rules")
+    parser.add_argument("--trace", help="JSON-lines file for the timing spans (default: trace.jsonl in the run directory)")
+    parser.add_argument("--metrics", help="Prometheus text file for the metrics (default: metrics.prom in the run directory)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    api_keys = parse_api_keys(args.api_keys)
+
+    if args.mode == "all" and not (args.url and args.file_name):
+        parser.error("mode all needs --url and --file-name")
+    if args.mode == "format" and not (args.input and args.file_name):
+        parser.error("mode format needs --input and --file-name")
+    if args.mode == "metadata" and not args.input:
+        parser.error("mode metadata needs --input")
+    if args.mode != "format" and not api_keys:
+        parser.error("at least one API key is required")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if not 0 <= args.similarity <= 1:
+        parser.error("--similarity must be between 0 and 1")
+
+    setup_logging(console=True)
+    pipeline = PromptPipeline(
+        dedup_threshold=args.similarity or None,
+        prompt_index_file=None if args.no_history else args.prompt_history,
+        rewrite_rules_file=args.rules,
+        trace_file=args.trace,
+        metrics_file=args.metrics,
+    )
+    try:
+        if args.mode == "all":
+            pipeline.run(args.url, args.file_name, args.start_number, args.max_attempts, args.file_prefix, api_keys,
+                         args.workers, ENGINES[args.engine], args.resume, args.variations)
+        elif args.mode == "format":
+            pipeline.run_format(args.input, args.file_name, args.start_number, args.file_prefix)
+        else:
+            pipeline.run_metadata(args.input, args.file_prefix, api_keys, args.resume)
+    except KeyboardInterrupt:
+        pipeline.update_output("Interrupted, rerun with --resume to continue")
+        return 130
+    except Exception as e:
+        pipeline.update_output(f"An error occurred: {str(e)}")
+        return 1
+    finally:
+        pipeline.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import asyncio
+import time
+
+from google.api_core import exceptions
+
+from key_pool import ApiKeyPool, INVALID_KEY_ERRORS, is_invalid_key_error
+from telemetry import Telemetry
+
+# Free tier quota of gemini-1.5-flash, raise these for paid keys
+GEMINI_REQUESTS_PER_MINUTE = 15
+GEMINI_TOKENS_PER_MINUTE = 1000000
+MAX_RETRIES = 6
+
+RETRYABLE_ERRORS = (exceptions.InternalServerError, exceptions.ServiceUnavailable)
+
+
+def genai_model_factory(api_key, model_name, generation_config):
+    """Build a GenerativeModel bound to its own API key.
+
+    genai.configure() is process-global, so each model gets a dedicated async client
+    instead; that lets requests for different keys run at the same time.
+    """
+    import google.generativeai as genai
+    from google.ai import generativelanguage as glm
+
+    model = genai.GenerativeModel(model_name, generation_config=generation_config)
+    model._async_client = glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+    return model
+
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English text
+    return max(1, len(text) // 4)
+
+
+class AdaptiveBatchSizer:
+    """Picks how many prompts go into one request from the observed parse success and latency.
+
+    Additive increase while responses parse completely and come back faster than
+    `target_latency`, multiplicative decrease when rows go missing or requests get slow.
+    """
+
+    def __init__(self, initial=5, minimum=1, maximum=20, target_latency=30.0):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.peak = initial
+
+    def record(self, requested, parsed, latency):
+        success = parsed / requested if requested else 0.0
+        if success >= 1.0 and latency <= self.target_latency:
+            self.size = min(self.maximum, self.size + 1)
+        elif success < 0.8 or latency > self.target_latency * 1.5:
+            self.size = max(self.minimum, self.size // 2)
+        self.peak = max(self.peak, self.size)
+
+
+class GeminiScheduler:
+    """Runs Gemini requests concurrently across all API keys.
+
+    Keys come from an ApiKeyPool, which enforces each key's requests-per-minute and
+    tokens-per-minute quota and routes every request to the healthiest key. A 429 or a
+    server error only affects the key that returned it; the request is retried on
+    whichever key is available first.
+
+    `model_factory(api_key, model_name, generation_config)` must return an object with an
+    async `generate_content_async(prompt, stream=True)` whose result is an async iterable of
+    chunks with a `.text`, so tests can pass a fake model instead of the real GenerativeModel.
+
+    Every request is recorded as a "gemini_request" span in `telemetry`, labelled with the key,
+    attempt, model and outcome (ok, throttled, server_error, invalid_key or error).
+    """
+
+    def __init__(self, api_keys, model_factory=genai_model_factory, requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=GEMINI_TOKENS_PER_MINUTE, max_retries=MAX_RETRIES, telemetry=None):
+        self.pool = ApiKeyPool(api_keys, requests_per_minute, tokens_per_minute)
+        self.model_factory = model_factory
+        self.max_retries = max_retries
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+
+    def model_for(self, key, model_name, generation_config):
+        cache_key = (model_name, tuple(sorted(generation_config.items())))
+        if cache_key not in key.models:
+            key.models[cache_key] = self.model_factory(key.api_key, model_name, generation_config)
+        return key.models[cache_key]
+
+    async def stream(self, prompt, model_name, generation_config):
+        """Yield the response text in chunks as the model produces them.
+
+        Failures before the first chunk are retried on another key like in `generate`; once
+        text has been yielded a failure is raised to the caller, which keeps what it parsed.
+        """
+        tokens = estimate_tokens(prompt)
+        last_error = None
+        for attempt in range(1, self.max_retries + 2):
+            key = await self.pool.acquire(tokens)
+            started = time.monotonic()
+            streamed = False
+            outcome = "error"
+            try:
+                model = self.model_for(key, model_name, generation_config)
+                response = await model.generate_content_async(prompt, stream=True)
+                async for chunk in response:
+                    text = chunk.text
+                    streamed = True
+                    yield text
+                outcome = "ok"
+            except exceptions.TooManyRequests as e:
+                outcome = "throttled"
+                self.pool.record_throttled(key)
+                if streamed:
+                    raise
+                last_error = e
+                continue
+            except RETRYABLE_ERRORS as e:
+                outcome = "server_error"
+                self.pool.record_error(key, e)
+                if streamed:
+                    raise
+                last_error = e
+                continue
+            except INVALID_KEY_ERRORS as e:
+                if not is_invalid_key_error(e):
+                    self.pool.release(key)
+                    raise
+                # The key is disabled and the request moves on to another one
+                outcome = "invalid_key"
+                self.pool.record_error(key, e)
+                if streamed:
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                self.pool.release(key)
+                raise
+            finally:
+                self.telemetry.record("gemini_request", time.monotonic() - started, key=key.index + 1, attempt=attempt,
+                                      model=model_name, outcome=outcome)
+            self.pool.record_success(key, time.monotonic() - started)
+            return
+        raise last_error
+
+    async def generate(self, prompt, model_name, generation_config):
+        return "".join([chunk async for chunk in self.stream(prompt, model_name, generation_config)])
+
+    def run(self, coroutine):
+        """Run a coroutine that uses this scheduler to completion from synchronous code."""
+        try:
+            return asyncio.run(coroutine)
+        finally:
+            # Async clients are tied to the event loop they were created on
+            for key in self.pool.keys:
+                key.models.clear()
+
+    def summary_lines(self):
+        return self.pool.summary_lines()
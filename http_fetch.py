@@ -0,0 +1,162 @@
+import http.client
+import threading
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+class EditorParagraphParser(HTMLParser):
+    """Streaming parser that collects the text of <p> tags inside the element with id="editorEl".
+
+    Feed it chunks as they arrive; `done` turns True as soon as the editor element is closed,
+    so the caller can stop parsing the rest of the page.
+    """
+
+    def __init__(self, element_id="editorEl"):
+        super().__init__(convert_charrefs=True)
+        self.element_id = element_id
+        self.found = False
+        self.done = False
+        self.paragraphs = []
+        self._editor_depth = 0
+        self._paragraph_parts = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self._editor_depth:
+            if tag == "br" and self._paragraph_parts is not None:
+                self._paragraph_parts.append("\n")
+            if tag in VOID_ELEMENTS:
+                return
+            self._editor_depth += 1
+            if tag == "p":
+                self._paragraph_parts = []
+        elif dict(attrs).get("id") == self.element_id and tag not in VOID_ELEMENTS:
+            self.found = True
+            self._editor_depth = 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self._editor_depth and tag == "br" and self._paragraph_parts is not None:
+            self._paragraph_parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if self.done or not self._editor_depth or tag in VOID_ELEMENTS:
+            return
+        if tag == "p" and self._paragraph_parts is not None:
+            self.paragraphs.append(self._paragraph_text())
+            self._paragraph_parts = None
+        self._editor_depth -= 1
+        if self._editor_depth == 0:
+            self.done = True
+
+    def handle_data(self, data):
+        if self._paragraph_parts is not None:
+            # Line breaks in the source render as spaces, only <br> breaks a line
+            self._paragraph_parts.append(data.replace("\r", " ").replace("\n", " "))
+
+    def _paragraph_text(self):
+        # Collapse whitespace the way the browser renders it, but keep <br> line breaks
+        lines = "".join(self._paragraph_parts).split("\n")
+        return "\n".join(" ".join(line.split()) for line in lines).strip()
+
+
+class HttpPromptFetcher:
+    """Fetches prompt pages over keep-alive HTTP connections and extracts `#editorEl p` text.
+
+    Connections are pooled per thread and per host, so one fetcher can be shared by all
+    scraping workers.
+    """
+
+    def __init__(self, user_agent, timeout=10, max_redirects=5, chunk_size=16384):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+
+    def fetch_paragraphs(self, link):
+        """Return the paragraph texts under #editorEl, or None if the element is not in the static HTML."""
+        url = link
+        for _ in range(self.max_redirects + 1):
+            response = self._request(url)
+            if response.status in (301, 302, 303, 307, 308):
+                location = response.getheader("Location")
+                response.read()
+                if not location:
+                    raise http.client.HTTPException(f"Redirect without Location header from {url}")
+                url = urljoin(url, location)
+                continue
+            if response.status != 200:
+                response.read()
+                raise http.client.HTTPException(f"HTTP {response.status} for {url}")
+            return self._parse_response(response)
+        raise http.client.HTTPException(f"Too many redirects for {link}")
+
+    def close(self):
+        connections = getattr(self._local, "connections", {})
+        for connection in connections.values():
+            connection.close()
+        connections.clear()
+
+    def _parse_response(self, response):
+        parser = EditorParagraphParser()
+        charset = response.headers.get_content_charset() or "utf-8"
+        while True:
+            chunk = response.read(self.chunk_size)
+            if not chunk:
+                break
+            if not parser.done:
+                parser.feed(chunk.decode(charset, errors="replace"))
+        # The rest of the body is still drained above so the connection can be reused
+        parser.close()
+        return parser.paragraphs if parser.found else None
+
+    def _request(self, url):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        headers = {
+            "User-Agent": self.user_agent,
+            "Accept": "text/html,application/xhtml+xml",
+            "Connection": "keep-alive",
+        }
+        # Retry once on a fresh connection if the server dropped the kept-alive one
+        for attempt in range(2):
+            connection = self._connection(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", path, headers=headers)
+                return connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self._drop_connection(parts.scheme, parts.netloc)
+                if attempt == 1:
+                    raise
+            except Exception:
+                self._drop_connection(parts.scheme, parts.netloc)
+                raise
+
+    def _connection(self, scheme, netloc):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        key = (scheme, netloc)
+        connection = connections.get(key)
+        if connection is None:
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            elif scheme == "http":
+                connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            else:
+                raise ValueError(f"Unsupported URL scheme: {scheme}")
+            connections[key] = connection
+        return connection
+
+    def _drop_connection(self, scheme, netloc):
+        connection = self._local.connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
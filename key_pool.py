@@ -0,0 +1,196 @@
+import asyncio
+import random
+import time
+
+from google.api_core import exceptions
+
+MAX_IN_FLIGHT_PER_KEY = 4
+BACKOFF_BASE = 2.0  # Seconds, doubled for every consecutive 429 on a key
+BACKOFF_MAX = 60.0
+QUARANTINE_AFTER_ERRORS = 3  # Consecutive non-429 failures before a key is quarantined
+QUARANTINE_COOLDOWN = 120.0
+HEALTH_SMOOTHING = 0.2  # Weight of the newest observation in the moving averages
+
+# Errors that can mean the key itself is unusable (revoked, wrong project, typo)
+INVALID_KEY_ERRORS = (exceptions.PermissionDenied, exceptions.Unauthenticated, exceptions.InvalidArgument)
+
+
+def is_invalid_key_error(error):
+    # Gemini reports a bad key as 400 INVALID_ARGUMENT "API key not valid", other 400s are about the request
+    if isinstance(error, exceptions.InvalidArgument):
+        return "api key" in str(error).lower()
+    return isinstance(error, INVALID_KEY_ERRORS)
+
+
+class NoUsableKeysError(RuntimeError):
+    """Every API key was rejected as invalid, no request can be sent any more."""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` tokens are available."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def remaining_fraction(self, now):
+        self._refill(now)
+        return max(0.0, self.tokens) / self.capacity
+
+
+class ApiKeyState:
+    def __init__(self, index, api_key, requests_per_minute, tokens_per_minute):
+        self.index = index
+        self.api_key = api_key
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.models = {}
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_throttles = 0
+        self.consecutive_errors = 0
+        self.disabled = False
+        self.success_rate = 1.0
+        self.latency = None
+        self.requests = 0
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+        self.quarantines = 0
+
+    @property
+    def label(self):
+        return f"API key {self.index + 1} (...{self.api_key[-4:]})"
+
+    def wait_time(self, tokens, now):
+        if self.in_flight >= MAX_IN_FLIGHT_PER_KEY:
+            return 0.05
+        return max(
+            self.cooldown_until - now,
+            self.request_bucket.wait_time(1, now),
+            self.token_bucket.wait_time(tokens, now),
+        )
+
+    def take(self, tokens, now):
+        self.request_bucket.take(1, now)
+        self.token_bucket.take(tokens, now)
+
+    def health(self, now):
+        # Higher is better: reliable, fast keys with the most quota left are preferred
+        latency = self.latency if self.latency is not None else 1.0
+        quota = min(self.request_bucket.remaining_fraction(now), self.token_bucket.remaining_fraction(now))
+        return self.success_rate * (0.5 + 0.5 * quota) / max(latency, 0.1)
+
+    def observe(self, success, latency=None):
+        self.success_rate += HEALTH_SMOOTHING * ((1.0 if success else 0.0) - self.success_rate)
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.latency + HEALTH_SMOOTHING * (latency - self.latency)
+
+
+class ApiKeyPool:
+    """Routes each Gemini request to the healthiest API key that has quota left.
+
+    Keys are tracked by success rate, latency, 429s and remaining per-minute quota.
+    A 429 puts the key into exponential backoff, repeated failures quarantine it for
+    QUARANTINE_COOLDOWN seconds, and keys rejected as invalid are disabled for the run.
+    Accepts any number of keys.
+    """
+
+    def __init__(self, api_keys, requests_per_minute, tokens_per_minute):
+        if not api_keys:
+            raise ValueError("At least one API key is required")
+        self.keys = [ApiKeyState(index, api_key, requests_per_minute, tokens_per_minute) for index, api_key in enumerate(api_keys)]
+
+    async def acquire(self, tokens):
+        while True:
+            now = time.monotonic()
+            usable = [key for key in self.keys if not key.disabled]
+            if not usable:
+                raise NoUsableKeysError("All API keys were rejected as invalid")
+            ready = []
+            shortest_wait = None
+            for key in usable:
+                wait = key.wait_time(tokens, now)
+                if wait <= 0:
+                    ready.append(key)
+                elif shortest_wait is None or wait < shortest_wait:
+                    shortest_wait = wait
+            if ready:
+                key = max(ready, key=lambda key: key.health(now))
+                key.take(tokens, now)
+                key.in_flight += 1
+                key.requests += 1
+                return key
+            await asyncio.sleep(shortest_wait)
+
+    def release(self, key):
+        # The request failed for a reason unrelated to the key, e.g. a blocked response
+        key.in_flight -= 1
+
+    def record_success(self, key, latency):
+        key.in_flight -= 1
+        key.successes += 1
+        key.consecutive_throttles = 0
+        key.consecutive_errors = 0
+        key.observe(True, latency)
+
+    def record_throttled(self, key):
+        # Exponential backoff with jitter, driven only by 429 responses
+        key.in_flight -= 1
+        key.throttled += 1
+        key.consecutive_throttles += 1
+        key.observe(False)
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (key.consecutive_throttles - 1))
+        key.cooldown_until = time.monotonic() + delay * random.uniform(0.8, 1.2)
+
+    def record_error(self, key, error):
+        key.in_flight -= 1
+        key.errors += 1
+        key.consecutive_errors += 1
+        key.observe(False)
+        if is_invalid_key_error(error):
+            if not key.disabled:
+                key.quarantines += 1
+            key.disabled = True
+        elif key.consecutive_errors >= QUARANTINE_AFTER_ERRORS:
+            key.cooldown_until = time.monotonic() + QUARANTINE_COOLDOWN
+            key.consecutive_errors = 0
+            key.quarantines += 1
+        else:
+            key.cooldown_until = max(key.cooldown_until, time.monotonic() + BACKOFF_BASE)
+
+    def summary_lines(self):
+        now = time.monotonic()
+        lines = []
+        for key in self.keys:
+            if key.disabled:
+                status = "disabled (invalid key)"
+            elif key.cooldown_until > now:
+                status = f"cooling down for {key.cooldown_until - now:.0f}s"
+            else:
+                status = "healthy"
+            latency = f"{key.latency:.2f}s" if key.latency is not None else "n/a"
+            quota = key.request_bucket.remaining_fraction(now) * 100
+            lines.append(
+                f"{key.label}: {key.requests} requests, {key.successes} succeeded, "
+                f"{key.throttled} rate limited (429), {key.errors} errors, {key.quarantines} quarantines, "
+                f"success rate {key.success_rate * 100:.0f}%, avg latency {latency}, "
+                f"{quota:.0f}% of per-minute quota left, {status}"
+            )
+        return lines
@@ -0,0 +1,82 @@
+import csv
+import os
+import re
+
+METADATA_VERSIONS = ("V1", "V2", "V3", "V4")
+METADATA_HEADER = ["File name", "Title", "Keywords", "Prompt", "Model"]
+MAX_KEYWORDS = 48
+
+
+def versioned_file_name(filename, version):
+    # "<prefix>V1-<serial>.jpg" -> "<prefix><version>-<serial>.jpg", other names are left alone
+    name, ext = os.path.splitext(filename)
+    match = re.match(r'(.+)V\d+(-\d+)$', name)
+    if match:
+        return f"{match.group(1)}{version}{match.group(2)}{ext}"
+    return filename
+
+
+class MetadataWriter:
+    """Writes the per-version metadata CSVs and their keyword-reduced copies in one pass.
+
+    Every row goes to `<prefix>-md-<version>.csv` and, with at most `max_keywords` keywords,
+    to `<prefix>-md-<version>-reduced.csv`. Files are flushed every `flush_every` rows so
+    they can be opened while a job is still running.
+    """
+
+    def __init__(self, file_prefix, versions=METADATA_VERSIONS, max_keywords=MAX_KEYWORDS, flush_every=50):
+        self.max_keywords = max_keywords
+        self.flush_every = flush_every
+        self.rows = 0
+        self.reduced_rows = 0
+        self.paths = []
+        self.files = []
+        self.outputs = []
+        try:
+            for version in versions:
+                full_path = f'{file_prefix}-md-{version}.csv'
+                reduced_path = f'{file_prefix}-md-{version}-reduced.csv'
+                writers = [version]
+                for path in (full_path, reduced_path):
+                    file = open(path, 'w', newline='', encoding='utf-8')
+                    self.files.append(file)
+                    writer = csv.writer(file, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                    writer.writerow(METADATA_HEADER)
+                    writers.append(writer)
+                self.outputs.append(writers)
+                self.paths.append((version, full_path, reduced_path))
+        except BaseException:
+            self.close()
+            raise
+
+    def write(self, file_name, row):
+        """Write one [title, keywords, prompt, model] row, returns True if its keywords were reduced."""
+        title, keywords, prompt, model = row
+        keyword_list = keywords.split(',')
+        reduced = len(keyword_list) > self.max_keywords
+        reduced_keywords = ','.join(keyword_list[:self.max_keywords]) if reduced else keywords
+        for version, full_writer, reduced_writer in self.outputs:
+            versioned_name = versioned_file_name(file_name, version)
+            full_writer.writerow([versioned_name, title, keywords, prompt, model])
+            reduced_writer.writerow([versioned_name, title, reduced_keywords, prompt, model])
+        self.rows += 1
+        if reduced:
+            self.reduced_rows += 1
+        if self.rows % self.flush_every == 0:
+            self.flush()
+        return reduced
+
+    def flush(self):
+        for file in self.files:
+            file.flush()
+
+    def close(self):
+        for file in self.files:
+            file.close()
+        self.files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
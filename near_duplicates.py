@@ -0,0 +1,178 @@
+import hashlib
+import re
+import sqlite3
+import time
+import uuid
+from array import array
+
+# Midjourney parameters such as "--ar 16:9", "--v 6.1", "--style raw" or "--tile"
+PARAMETER_PATTERN = re.compile(r'--[a-z]+(?:\s+(?!--)[^\s,]+)?', re.IGNORECASE)
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+SIGNATURE_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'  # 32-bit unsigned
+TOKEN_CACHE_SIZE = 20000
+BUSY_TIMEOUT = 30  # Seconds to wait for another run's write to finish
+# Prompts of a run that died without closing the index are removed after this many seconds
+PENDING_TTL = 3 * 24 * 3600
+
+
+def normalize_prompt(prompt):
+    """Lowercase the prompt and drop parameters, punctuation and extra whitespace."""
+    prompt = PARAMETER_PATTERN.sub(' ', prompt.lower())
+    return ' '.join(NON_WORD_PATTERN.sub(' ', prompt).split())
+
+
+def stable_hash(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True)
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index of normalized prompts stored in SQLite.
+
+    Prompts are compared by the Jaccard similarity of their normalized word sets, estimated
+    from `num_perm` MinHash values. Signatures are split into bands of `rows` values; only
+    prompts sharing a band are compared, so lookups stay fast for very large corpora and
+    nothing is held in memory. The default 16 bands of 4 rows find nearly all pairs above
+    a threshold of 0.6.
+
+    Every new prompt is written right away, so several runs can share one file without
+    waiting on each other, but it is tagged with this run's id and only becomes history
+    for other runs on `commit()`. Closing without `commit()` removes the run's prompts, so
+    an interrupted run leaves the history untouched and can be repeated without matching
+    against itself.
+    """
+
+    def __init__(self, path=":memory:", threshold=0.8, num_perm=64, rows=4, seed=1):
+        if num_perm % rows:
+            raise ValueError("num_perm must be a multiple of rows")
+        self.path = path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.rows = rows
+        self.salt = seed.to_bytes(8, 'little')
+        self.token_cache = {}
+        self.run_id = uuid.uuid4().hex
+        self.committed = False
+        # The pipeline opens the index before its stage threads start and commits it after they end
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # run_id is NULL for the history, otherwise the prompt belongs to a run that has not finished yet
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS prompts (id INTEGER PRIMARY KEY, prompt TEXT NOT NULL, signature BLOB NOT NULL, run_id TEXT, created REAL)"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS bands (band_key INTEGER NOT NULL, prompt_id INTEGER NOT NULL)")
+        self._add_missing_columns({"run_id": "TEXT", "created": "REAL"})
+        self.connection.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands (band_key)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS prompts_run ON prompts (run_id)")
+        self._check_settings({"hash": "shake128-32", "num_perm": str(num_perm), "rows": str(rows), "seed": str(seed)})
+        self.connection.commit()
+        self._remove_pending("run_id IS NOT NULL AND created < ?", (time.time() - PENDING_TTL,))
+        self.history_size = self.connection.execute("SELECT COUNT(*) FROM prompts WHERE run_id IS NULL").fetchone()[0]
+        self.added = 0
+
+    def _add_missing_columns(self, columns):
+        # Files written before prompts were tagged by run only hold history
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(prompts)")}
+        for name, column_type in columns.items():
+            if name in existing:
+                continue
+            try:
+                self.connection.execute(f"ALTER TABLE prompts ADD COLUMN {name} {column_type}")
+            except sqlite3.OperationalError as e:
+                # Another run added it first
+                if "duplicate column" not in str(e):
+                    raise
+
+    def _remove_pending(self, condition, params):
+        if self.connection.execute(f"SELECT 1 FROM prompts WHERE {condition} LIMIT 1", params).fetchone() is None:
+            return
+        self.connection.execute(f"DELETE FROM bands WHERE prompt_id IN (SELECT id FROM prompts WHERE {condition})", params)
+        self.connection.execute(f"DELETE FROM prompts WHERE {condition}", params)
+        self.connection.commit()
+
+    def _check_settings(self, settings):
+        stored = dict(self.connection.execute("SELECT name, value FROM settings"))
+        if not stored:
+            self.connection.executemany("INSERT INTO settings (name, value) VALUES (?, ?)", settings.items())
+        elif stored != settings:
+            raise ValueError(f"{self.path} was built with different MinHash settings {stored}")
+
+    def token_hashes(self, token):
+        # One extendable-output digest gives every hash function's value for the token at once
+        hashes = self.token_cache.get(token)
+        if hashes is None:
+            hashes = array(SIGNATURE_TYPECODE, hashlib.shake_128(self.salt + token.encode('utf-8')).digest(4 * self.num_perm))
+            if len(self.token_cache) >= TOKEN_CACHE_SIZE:
+                self.token_cache.clear()
+            self.token_cache[token] = hashes
+        return hashes
+
+    def signature(self, tokens):
+        return array(SIGNATURE_TYPECODE, map(min, zip(*(self.token_hashes(token) for token in tokens))))
+
+    def band_keys(self, signature):
+        keys = []
+        for band, start in enumerate(range(0, self.num_perm, self.rows)):
+            keys.append(stable_hash(band.to_bytes(2, 'little') + signature[start:start + self.rows].tobytes()))
+        return keys
+
+    def find(self, signature, band_keys):
+        """Return (similarity, prompt, from_history) of the closest prompt above the threshold, or None.
+
+        Only the history and this run's own prompts are searched, not those of other unfinished runs.
+        """
+        placeholders = ",".join("?" * len(band_keys))
+        candidates = self.connection.execute(
+            f"SELECT prompt, signature, run_id FROM prompts WHERE id IN (SELECT prompt_id FROM bands WHERE band_key IN ({placeholders})) "
+            "AND (run_id IS NULL OR run_id = ?)",
+            band_keys + [self.run_id],
+        ).fetchall()
+        best = None
+        for prompt, stored, run_id in candidates:
+            stored_signature = array(SIGNATURE_TYPECODE)
+            stored_signature.frombytes(stored)
+            similarity = sum(1 for x, y in zip(signature, stored_signature) if x == y) / self.num_perm
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, prompt, run_id is None)
+        return best
+
+    def check_and_add(self, prompt):
+        """Return the closest earlier match as (similarity, prompt, from_history), or add the prompt and return None.
+
+        A prompt without words (only emoji or parameters) has no signature to compare, it is
+        left to the exact duplicate check and not stored.
+        """
+        tokens = set(normalize_prompt(prompt).split())
+        if not tokens:
+            return None
+        signature = self.signature(tokens)
+        band_keys = self.band_keys(signature)
+        match = self.find(signature, band_keys)
+        if match is not None:
+            return match
+        prompt_id = self.connection.execute(
+            "INSERT INTO prompts (prompt, signature, run_id, created) VALUES (?, ?, ?, ?)",
+            (prompt, signature.tobytes(), self.run_id, time.time()),
+        ).lastrowid
+        self.connection.executemany("INSERT INTO bands (band_key, prompt_id) VALUES (?, ?)", [(key, prompt_id) for key in band_keys])
+        # The write lock is only held for this one prompt, other runs sharing the file are not blocked
+        self.connection.commit()
+        self.added += 1
+        return None
+
+    def stats_line(self):
+        return f"Prompt history: {self.history_size} earlier prompts, {self.added} added by this run"
+
+    def commit(self):
+        """Make this run's prompts part of the history."""
+        self.connection.execute("UPDATE prompts SET run_id = NULL WHERE run_id = ?", (self.run_id,))
+        self.connection.commit()
+        self.committed = True
+
+    def close(self):
+        try:
+            if not self.committed:
+                self._remove_pending("run_id = ?", (self.run_id,))
+        finally:
+            self.connection.close()
@@ -0,0 +1,1476 @@
+import asyncio
+import collections
+import csv
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from browser_pool import DriverPool, block_resources, resolve_driver_path, BLOCKED_CONTENT_PREFERENCES, GALLERY_BLOCKED_URL_PATTERNS
+from http_fetch import HttpPromptFetcher
+from cache_store import DiskCache, ResponseMemo
+from checkpoint import RunCheckpoint
+from metadata_writer import MetadataWriter, MAX_KEYWORDS
+from near_duplicates import NearDuplicateIndex
+from rewrite_rules import RewriteRules
+from structured_output import JsonRecordParser, stream_records
+from telemetry import Telemetry
+
+# selenium, webdriver_manager and google.generativeai are imported where they are used,
+# so format-only and metadata-only jobs start without loading the browser stack
+
+logger = logging.getLogger("gate2ai")
+
+DEFAULT_SCRAPE_WORKERS = 4
+DEFAULT_MAX_ATTEMPTS = 4
+STAGE_QUEUE_SIZE = 500  # Prompts buffered between two stages before the earlier one waits
+LOG_FILE = "gate2ai.log"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+SCRAPE_ENGINE_HTTP = "HTTP (browser fallback)"
+SCRAPE_ENGINE_SELENIUM = "Browser only"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.6478.127 Safari/537.36"
+PAGE_WAIT_TIMEOUT = 10  # Max seconds to wait for #editorEl on a prompt page
+SCROLL_WAIT_TIMEOUT = 15  # Max seconds to wait for new cards after a scroll
+DRIVER_MAX_PAGES = 200  # A browser is replaced after this many pages to bound its memory
+WARM_DRIVERS = 1  # Browsers kept running between runs
+SCROLL_SETTLE_TIME = 3  # Seconds the document height must stay unchanged to treat a scroll as finished
+# What the old fixed sleeps cost per wait, used to report the time saved
+FIXED_SCROLL_WAIT = 15
+FIXED_PAGE_WAIT = 3
+SCRAPE_CACHE_FILE = "scrape_cache.sqlite3"
+SCRAPE_CACHE_TTL = 14 * 24 * 3600  # Prompt pages rarely change, re-fetch them after two weeks
+SCRAPE_CACHE_MAX_ENTRIES = 200000
+RUNS_DIR = "runs"  # Checkpoints of each run are kept in runs/<file prefix>/
+# Written next to the checkpoints unless other files are given
+TRACE_FILE_NAME = "trace.jsonl"
+METRICS_FILE_NAME = "metrics.prom"
+# Every formatted prompt is remembered here, so later crawls skip prompts that were already processed
+PROMPT_INDEX_FILE = "prompt_index.sqlite3"
+NEAR_DUPLICATE_THRESHOLD = 0.8  # Estimated Jaccard similarity of the normalized words
+REWRITE_RULES_FILE = "rewrite_rules.json"  # Without this file prompts only get "--v 6.1"
+RESPONSE_CACHE_FILE = "gemini_cache.sqlite3"
+RESPONSE_CACHE_TTL = 30 * 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 500000
+
+VARIATIONS_MODEL = 'gemini-1.5-flash'
+# JSON mode makes the model answer with the records asked for below, without Markdown around them
+VARIATIONS_GENERATION_CONFIG = {"temperature": 0.7, "response_mime_type": "application/json"}
+VARIATIONS_PER_PROMPT = 5  # The parent prompt followed by its 4 variations
+VARIATIONS_PROMPT_TEMPLATE = """
+        I want you to give me 4 iterations for each of the following prompts. Make sure the variation rating should be 9/10, make sure to variate them in a more descriptive manner and they should not be the same. 
+        Make sure the prompts should create different pictures but with the same sense as defined in the parent prompts.
+        They are just prompts, not the actual content. So you can change the words, phrases and you can give a simple response to the prompt if it contains any violated content.
+        Every prompt below is a JSON object with an "id" and the parent "prompt". Answer with a JSON array holding one object per prompt, in the same order, like this:
+        [
+          {{"id": 1, "prompt": "This is parent prompt 1", "variations": ["variation1 for parent prompt 1", "variation2 for parent prompt 1", "variation3 for parent prompt 1", "variation4 for parent prompt 1"]}},
+          {{"id": 2, "prompt": "This is parent prompt 2", "variations": ["variation1 for parent prompt 2", "variation2 for parent prompt 2", "variation3 for parent prompt 2", "variation4 for parent prompt 2"]}}
+        ]
+        Copy the "id" exactly and give exactly 4 variations for every prompt.
+
+        Here are the prompts:
+        {prompts_str}
+        """
+
+METADATA_MODEL = 'gemini-1.5-flash'
+METADATA_GENERATION_CONFIG = {"temperature": 0.4, "response_mime_type": "application/json"}
+# Prompts may run this far ahead of the oldest unfinished one, which bounds the rows held back to keep the output in order
+METADATA_REORDER_WINDOW = 2000
+METADATA_MODEL_NAME = "Midjourney 6"
+METADATA_PROMPT_TEMPLATE = """
+        Generate metadata for the pictures according to the following prompts.
+        * For 'id', copy the "id" of the prompt exactly.
+        * For 'title', generate a description containing only 4 words make sure not to use any artist or personality name give short description and dont use "in the style of", a very easy and small description under 100 characters and straight ....
+        * For 'keywords', generate 30 keywords (not less then 30) each consisting of only one word.make sure to add the easy words which are used by human on daily basis.It is so so so so so so so important to generate 30 keywords for each corresponding prompt, means the one metadeta will contain 30 keywords, not less then 30.
+        * For 'prompt', modify the prompt to make it more concise and clear and short like only 10 words, make sure not to use any artist name or personality name or any style name. 
+        * For 'model', use Midjourney 6 model.
+        Every prompt below is a JSON object with an "id" and the "prompt". Answer with a JSON array holding one object per prompt, in the same order, like this:
+        [
+          {{"id": 1, "title": "A beautiful landscape with a river and mountains in the background", "keywords": ["landscape", "river", "mountains", "beautiful", "background", "water", "sky", "clouds", "trees", "green", "blue"], "prompt": "A beautiful landscape with a river and mountains", "model": "Midjourney 6"}},
+          {{"id": 2, "title": "A beautiful landscape with a river and mountains in the background", "keywords": ["landscape", "river", "mountains", "beautiful", "background", "water", "sky", "clouds", "trees", "green", "blue"], "prompt": "A beautiful landscape with a river and mountains", "model": "Midjourney 6"}}
+        ]
+
+        I will give you {count} promts at once, make sure to give me {count} meta data and Here are the prompts: 
+        {prompts_str}
+        """
+
+# Marks every card it returns so each call only yields cards added since the previous one
+HARVEST_NEW_CARDS_SCRIPT = """
+var cards = document.querySelectorAll('a.prompt-card:not([data-harvested])');
+var hrefs = [];
+for (var i = 0; i < cards.length; i++) {
+    cards[i].setAttribute('data-harvested', '1');
+    hrefs.push(cards[i].href);
+}
+return [document.querySelectorAll('a.prompt-card').length, hrefs];
+"""
+
+class WaitStats:
+    """Thread-safe record of how long each kind of wait took during a crawl."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waits = {}
+
+    def record(self, name, seconds, fixed_seconds, timed_out=False):
+        with self.lock:
+            stats = self.waits.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "fixed": 0.0, "timeouts": 0})
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["fixed"] += fixed_seconds
+            if timed_out:
+                stats["timeouts"] += 1
+
+    def summary_lines(self):
+        with self.lock:
+            lines = []
+            for name, stats in self.waits.items():
+                average = stats["total"] / stats["count"]
+                saved = stats["fixed"] - stats["total"]
+                lines.append(
+                    f"{name}: {stats['count']} waits, {stats['total']:.1f}s total, {average:.2f}s avg, "
+                    f"{stats['max']:.2f}s max, {stats['timeouts']} timeouts, {saved:.1f}s saved vs fixed sleeps"
+                )
+            return lines
+
+class LinkStream:
+    """Queue of (index, link) pairs that scraping workers consume while links are still being discovered."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.count = 0
+        self.closed = False
+
+    def put_many(self, links):
+        for link in links:
+            self.queue.put((self.count, link))
+            self.count += 1
+
+    def close(self):
+        self.closed = True
+        self.queue.put(None)
+
+    def get(self):
+        while True:
+            item = self.queue.get()
+            if item is not None:
+                return item
+            # Leave the end marker in place for the other workers, links requeued after it are still handed out
+            self.queue.put(None)
+            if self.queue.qsize() <= 1:
+                return None
+
+    def requeue(self, item):
+        self.queue.put(item)
+
+    def discard_pending(self):
+        # Drops the links no worker has taken yet, so the workers stop after their current page
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+class StageCancelled(Exception):
+    """Raised in a stage whose queue was cancelled because a later stage stopped."""
+
+class StageQueue:
+    """Bounded queue that connects two pipeline stages running at the same time.
+
+    `put` blocks while the queue is full, so a producer that gets ahead of a slow consumer
+    waits instead of buffering its whole output; the time it waited is kept in `blocked`.
+    The producer ends the stream with `close`, passing its exception if it failed, which is
+    then raised in the consumer. Iterating blocks for the next item; async stages use
+    `get_async`/`put_async`, or `poll`, so they never block the event loop. `cancel` makes
+    both sides raise StageCancelled, that is how a failed run stops the other stages.
+    """
+
+    END = object()
+    NOT_READY = object()
+
+    def __init__(self, maxsize=STAGE_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize)
+        self.count = 0
+        self.blocked = 0.0
+        self.closed = False
+        self.cancelled = False
+        self.error = None
+
+    def put(self, item):
+        started = None
+        while True:
+            if self.cancelled:
+                raise StageCancelled()
+            try:
+                if started is None:
+                    self.queue.put_nowait(item)
+                else:
+                    self.queue.put(item, timeout=0.2)
+                break
+            except queue.Full:
+                if started is None:
+                    started = time.monotonic()
+        if started is not None:
+            self.blocked += time.monotonic() - started
+        self.count += 1
+
+    async def put_async(self, item):
+        started = None
+        while True:
+            if self.cancelled:
+                raise StageCancelled()
+            try:
+                self.queue.put_nowait(item)
+                break
+            except queue.Full:
+                if started is None:
+                    started = time.monotonic()
+                await asyncio.sleep(0.05)
+        if started is not None:
+            self.blocked += time.monotonic() - started
+        self.count += 1
+
+    def close(self, error=None):
+        self.error = error
+        self.closed = True
+
+    def cancel(self):
+        self.cancelled = True
+
+    def poll(self):
+        """Return the next item, NOT_READY if the producer has not made one yet, or END."""
+        if self.cancelled:
+            raise StageCancelled()
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            if not self.closed:
+                return StageQueue.NOT_READY
+        # Items put just before the queue was closed are still handed out
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        if self.error is not None:
+            raise self.error
+        return StageQueue.END
+
+    async def get_async(self):
+        while True:
+            item = self.poll()
+            if item is not StageQueue.NOT_READY:
+                return item
+            await asyncio.sleep(0.05)
+
+    def __iter__(self):
+        while True:
+            item = self.poll()
+            if item is StageQueue.END:
+                return
+            if item is StageQueue.NOT_READY:
+                try:
+                    item = self.queue.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+            yield item
+
+    def stats_line(self, name):
+        return f"{name}: {self.count} items passed on, waited {self.blocked:.1f}s for the next stage to catch up"
+
+def setup_logging(log_file=LOG_FILE, console=False):
+    if logger.handlers:
+        return
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+    handler = RotatingFileHandler(log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8")
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter("%(message)s"))
+        console_handler.setLevel(logging.INFO)
+        logger.addHandler(console_handler)
+    logger.setLevel(logging.DEBUG)
+
+def parse_api_keys(text):
+    # Keys may be separated by commas, spaces or new lines, duplicates are dropped
+    api_keys = []
+    for api_key in re.split(r'[\s,;]+', text):
+        if api_key and api_key not in api_keys:
+            api_keys.append(api_key)
+    return api_keys
+
+def iter_prompts(input_file):
+    # One prompt per line, or the first column of a CSV with a "Prompts" header
+    with open(input_file, 'r', newline='', encoding='utf-8') as infile:
+        if input_file.lower().endswith('.csv'):
+            for row_number, row in enumerate(csv.reader(infile)):
+                if row and not (row_number == 0 and row[0] == "Prompts"):
+                    yield row[0]
+        else:
+            for line in infile:
+                if line.strip():
+                    yield line.rstrip('\n')
+
+class PromptPipeline:
+    """Scrape → variations → format → metadata pipeline without any UI.
+
+    `log` and `progress` are optional callbacks for messages and a 0-1 progress value;
+    every message is also written to the "gate2ai" logger. Both may be called from
+    worker threads. Prompts at least `dedup_threshold` similar to an earlier one, in this
+    run or in `prompt_index_file`, are dropped while formatting; a threshold of None only
+    drops exact duplicates and a `prompt_index_file` of None keeps no history. Unique
+    prompts are then rewritten by the rules in `rewrite_rules_file`.
+
+    Stages, page loads, waits, Gemini requests, parsing and CSV writes are timed in
+    `self.telemetry`. A run writes the spans to `trace_file` and Prometheus metrics to
+    `metrics_file`, by default trace.jsonl and metrics.prom in its run directory.
+    """
+
+    def __init__(self, log=None, progress=None, dedup_threshold=NEAR_DUPLICATE_THRESHOLD, prompt_index_file=PROMPT_INDEX_FILE,
+                 rewrite_rules_file=REWRITE_RULES_FILE, trace_file=None, metrics_file=None):
+        self.log = log
+        self.progress = progress
+        self.dedup_threshold = dedup_threshold
+        self.prompt_index_file = prompt_index_file
+        self.rewrite_rules_file = rewrite_rules_file
+        self.trace_file = trace_file
+        self.metrics_file = metrics_file
+        self.wait_stats = WaitStats()
+        self.telemetry = Telemetry()
+        # Browsers are only started when a page needs one and are reused by later stages and runs
+        self.driver_pool = DriverPool(self.setup_driver, max_pages=DRIVER_MAX_PAGES)
+
+    def close(self):
+        """Quit the browsers kept warm for the next run."""
+        self.driver_pool.close()
+
+    def update_output(self, message):
+        logger.info(message)
+        if self.log is not None:
+            self.log(message)
+
+    def update_progress(self, value):
+        if self.progress is not None:
+            self.progress(value)
+
+    def open_caches(self):
+        scrape_cache = DiskCache(SCRAPE_CACHE_FILE, ttl=SCRAPE_CACHE_TTL, max_entries=SCRAPE_CACHE_MAX_ENTRIES)
+        response_cache = DiskCache(RESPONSE_CACHE_FILE, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+        return scrape_cache, response_cache
+
+    def open_telemetry(self, run_dir=None):
+        # Files given to the pipeline win, otherwise a run keeps its trace and metrics next to its checkpoints
+        trace_file = self.trace_file or (os.path.join(run_dir, TRACE_FILE_NAME) if run_dir else None)
+        metrics_file = self.metrics_file or (os.path.join(run_dir, METRICS_FILE_NAME) if run_dir else None)
+        self.telemetry = Telemetry(trace_file, metrics_file)
+
+    def close_telemetry(self):
+        self.telemetry.close()
+        lines = self.telemetry.summary_lines()
+        if lines:
+            self.update_output("Time spent by span:")
+            for line in lines:
+                self.update_output(line)
+        if self.telemetry.trace_file:
+            self.update_output(f"Trace written to {self.telemetry.trace_file}")
+        if self.telemetry.metrics_file:
+            self.update_output(f"Metrics written to {self.telemetry.metrics_file}")
+
+    def create_scheduler(self, api_keys):
+        from gemini_client import GeminiScheduler
+        return GeminiScheduler(api_keys, telemetry=self.telemetry)
+
+    def run(self, url, file_name, start_number, max_attempts, file_prefix, api_keys, num_workers=DEFAULT_SCRAPE_WORKERS, scrape_engine=SCRAPE_ENGINE_HTTP, resume=False, generate_variations=False):
+        """Run every stage for one gallery URL, the same job the Start Process button starts.
+
+        The stages run at the same time, connected by bounded StageQueues: a prompt moves on to
+        variations, formatting and metadata as soon as its page is scraped, and a stage that falls
+        behind makes the earlier ones wait instead of letting prompts pile up in memory.
+        """
+        scrape_cache = None
+        response_cache = None
+        checkpoint = None
+        prompt_index = None
+        try:
+            scrape_cache, response_cache = self.open_caches()
+            checkpoint = RunCheckpoint(
+                RunCheckpoint.run_dir_for(RUNS_DIR, file_prefix),
+                resume=resume,
+                params={"url": url, "file_name": file_name, "start_number": start_number, "file_prefix": file_prefix, "generate_variations": generate_variations},
+            )
+            if resume:
+                self.update_output(f"Resuming from checkpoints in {checkpoint.run_dir}")
+            self.open_telemetry(checkpoint.run_dir)
+            self.wait_stats = WaitStats()
+            scheduler = self.create_scheduler(api_keys)
+            prompt_index = self.open_prompt_index()
+
+            format_checkpoint = checkpoint.stage("format")
+            if format_checkpoint.done:
+                # Everything before formatting finished in the interrupted run, only metadata is left
+                formatted, total_prompts = self.format_stage(None, file_name, start_number, file_prefix, format_checkpoint)
+                self.update_output("Generating metadata for V1, V2, V3, and V4...")
+                with self.telemetry.span("stage", stage="metadata"):
+                    self.generate_metadata(formatted, scheduler, file_prefix, checkpoint=checkpoint.stage("metadata"), response_cache=response_cache, total_prompts=total_prompts)
+                if prompt_index is not None:
+                    # The interrupted run's prompts were taken out of the history when it stopped
+                    for record in format_checkpoint.records:
+                        prompt_index.check_and_add(self.prompt_text(record["prompt"]))
+            else:
+                self.run_stages(url, file_name, start_number, max_attempts, file_prefix, scheduler, num_workers, scrape_engine,
+                                generate_variations, scrape_cache, response_cache, checkpoint, prompt_index)
+            if prompt_index is not None:
+                # Prompts only become history once their metadata is written, a failed run can be repeated without resuming
+                prompt_index.commit()
+                self.update_output(prompt_index.stats_line())
+        finally:
+            if prompt_index is not None:
+                prompt_index.close()
+            if checkpoint is not None:
+                checkpoint.close()
+                self.close_telemetry()
+            if self.driver_pool.launches:
+                self.driver_pool.trim(WARM_DRIVERS)
+                self.update_output(self.driver_pool.stats_line())
+            if scrape_cache is not None:
+                self.update_output(scrape_cache.stats_line("Scrape cache"))
+                scrape_cache.close()
+            if response_cache is not None:
+                response_cache.close()
+
+    def run_stages(self, url, file_name, start_number, max_attempts, file_prefix, scheduler, num_workers, scrape_engine,
+                   generate_variations, scrape_cache, response_cache, checkpoint, prompt_index=None):
+        # Scraping and formatting run in threads, variations and metadata share the scheduler's event loop
+        started = time.monotonic()
+        scraped = StageQueue()
+        queues = [("Scraping", scraped)]
+        content = scraped
+        if generate_variations:
+            # Duplicates are dropped before variations are paid for, the variations are then only
+            # checked for exact duplicates, they are meant to resemble their parent prompt
+            unique = StageQueue()
+            queues.append(("Deduplication", unique))
+            content = StageQueue()
+            queues.append(("Variations", content))
+        formatted = StageQueue()
+        queues.append(("Formatting", formatted))
+        format_checkpoint = checkpoint.stage("format")
+        variations_checkpoint = checkpoint.stage("variations")
+        metadata_checkpoint = checkpoint.stage("metadata")
+
+        def scrape():
+            self.update_output("Starting web scraping...")
+            with self.telemetry.span("stage", stage="scrape"):
+                self.scrape_gallery(url, max_attempts, num_workers, scrape_engine, scrape_cache, checkpoint, output=scraped)
+
+        def deduplicate():
+            with self.telemetry.span("stage", stage="deduplicate"):
+                for prompt in self.unique_prompts(scraped, index=prompt_index):
+                    unique.put(prompt)
+
+        def format_prompts():
+            with self.telemetry.span("stage", stage="format"):
+                pairs, _ = self.format_stage(content, file_name, start_number, file_prefix, format_checkpoint,
+                                             near_duplicates=not generate_variations, index=prompt_index)
+                for pair in pairs:
+                    formatted.put(pair)
+
+        async def variations():
+            self.update_output("Generating variations for scraped prompts...")
+            error = None
+            try:
+                with self.telemetry.span("stage", stage="variations"):
+                    await self.generate_variations_async(unique, scheduler, checkpoint=variations_checkpoint, response_cache=response_cache, output=content)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                content.close(error)
+
+        async def metadata():
+            with self.telemetry.span("stage", stage="metadata"):
+                await self.generate_metadata_async(formatted, scheduler, file_prefix, checkpoint=metadata_checkpoint, response_cache=response_cache)
+
+        async def api_stages():
+            stages = [metadata()]
+            if generate_variations:
+                stages.append(variations())
+            await asyncio.gather(*stages)
+
+        threads = [self.start_stage("scrape", scrape, scraped), self.start_stage("format", format_prompts, formatted)]
+        if generate_variations:
+            threads.append(self.start_stage("deduplicate", deduplicate, unique))
+        try:
+            self.update_output("Generating metadata for V1, V2, V3, and V4 as prompts are formatted...")
+            scheduler.run(api_stages())
+        finally:
+            # A failed stage stops all the others before the checkpoints are closed
+            for _, stage_queue in queues:
+                stage_queue.cancel()
+            for thread in threads:
+                thread.join()
+
+        for name, stage_queue in queues:
+            self.update_output(stage_queue.stats_line(name))
+        self.update_output(f"All stages finished in {time.monotonic() - started:.1f}s")
+
+    def start_stage(self, name, produce, output):
+        # Runs produce() in a thread, `output` is closed when it returns and gets the error if it fails
+        def target():
+            error = None
+            try:
+                produce()
+            except StageCancelled:
+                pass
+            except BaseException as e:
+                error = e
+            finally:
+                output.close(error)
+
+        thread = threading.Thread(target=target, name=f"{name} stage", daemon=True)
+        thread.start()
+        return thread
+
+    def run_format(self, input_file, file_name, start_number, file_prefix):
+        """Format a file of raw prompts into the numbered prompt CSV."""
+        self.update_output(f"Formatting prompts from {input_file}...")
+        self.open_telemetry()
+        try:
+            with self.telemetry.span("stage", stage="format"):
+                return self.format_content(iter_prompts(input_file), file_name, start_number, file_prefix)
+        finally:
+            self.close_telemetry()
+
+    def run_metadata(self, formatted_file, file_prefix, api_keys, resume=False):
+        """Generate the metadata CSVs for an already formatted prompt CSV."""
+        total_prompts = sum(1 for _ in iter_prompts(formatted_file))
+        formatted = ((prompt, f"{file_prefix}V1-{self.prompt_serial(prompt)}.jpg") for prompt in iter_prompts(formatted_file))
+        self.update_output(f"Found {total_prompts} formatted prompts in {formatted_file}")
+        response_cache = DiskCache(RESPONSE_CACHE_FILE, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+        checkpoint = RunCheckpoint(
+            RunCheckpoint.run_dir_for(RUNS_DIR, f"{file_prefix}-metadata"),
+            resume=resume,
+            params={"formatted_file": formatted_file, "file_prefix": file_prefix},
+        )
+        self.open_telemetry(checkpoint.run_dir)
+        try:
+            with self.telemetry.span("stage", stage="metadata"):
+                self.generate_metadata(formatted, self.create_scheduler(api_keys), file_prefix, checkpoint=checkpoint.stage("metadata"), response_cache=response_cache, total_prompts=total_prompts)
+        finally:
+            checkpoint.close()
+            response_cache.close()
+            self.close_telemetry()
+
+    def format_stage(self, content, file_name, start_number, file_prefix, format_checkpoint, near_duplicates=True, index=None):
+        """Return a lazy iterator of (numbered prompt, file name) pairs and the expected number of prompts."""
+        if format_checkpoint.done:
+            self.update_output(f"Formatting already completed, restored {len(format_checkpoint.records)} prompts from checkpoint")
+            formatted = ((record["prompt"], record["file_name"]) for record in format_checkpoint.records)
+            return formatted, len(format_checkpoint.records)
+
+        self.update_output("Starting formatting...")
+        formatted = self.write_formatted_content(self.format_prompts(content, start_number, file_prefix, near_duplicates, index), file_name)
+        # A StageQueue that is still being filled has no length yet
+        total_prompts = len(content) if isinstance(content, list) else None
+        return self.checkpoint_formatted(formatted, format_checkpoint), total_prompts
+
+    def checkpoint_formatted(self, formatted, format_checkpoint):
+        # An unfinished format stage is redone from the start. The prompts can come in a different order
+        # than in the interrupted run, so its records are replaced rather than continued
+        format_checkpoint.reset()
+        for prompt, prompt_file_name in formatted:
+            format_checkpoint.append({"prompt": prompt, "file_name": prompt_file_name})
+            yield prompt, prompt_file_name
+        format_checkpoint.mark_done()
+
+    def scrape_gallery(self, url, max_attempts, num_workers, scrape_engine, scrape_cache, checkpoint, output=None):
+        # Returns the paragraphs in link order, or puts them into the `output` StageQueue as pages finish
+        links_checkpoint = checkpoint.stage("links")
+        scrape_checkpoint = checkpoint.stage("scrape")
+        checkpointed_links = [record["link"] for record in links_checkpoint.records]
+
+        if scrape_checkpoint.done:
+            scraped = {record["link"]: record["paragraphs"] for record in scrape_checkpoint.records}
+            content = [paragraph for link in checkpointed_links for paragraph in scraped.get(link, [])]
+            self.update_output(f"Scraping already completed, restored {len(content)} paragraphs from checkpoint")
+            if output is not None:
+                for paragraph in content:
+                    output.put(paragraph)
+            return content
+
+        self.update_output(f"Scraping content from links with {num_workers} workers ({scrape_engine}) while scrolling...")
+
+        # Page scraping starts on the first harvested links while the gallery is still being scrolled
+        link_stream = LinkStream()
+        scrape_result = {}
+
+        def scrape_stream():
+            try:
+                scrape_result["content"] = self.scrape_content_from_link_stream(
+                    link_stream, num_workers=num_workers, scrape_engine=scrape_engine,
+                    scrape_cache=scrape_cache, scrape_checkpoint=scrape_checkpoint, output=output,
+                )
+            except Exception as e:
+                scrape_result["error"] = e
+
+        scrape_thread = threading.Thread(target=scrape_stream, daemon=True)
+        scrape_thread.start()
+        try:
+            if links_checkpoint.done:
+                self.update_output(f"Link collection already completed, restored {len(checkpointed_links)} links from checkpoint")
+                link_stream.put_many(checkpointed_links)
+            else:
+                recorded_links = set(checkpointed_links)
+
+                def on_new_links(new_links):
+                    if output is not None and output.cancelled:
+                        raise StageCancelled()
+                    link_stream.put_many(new_links)
+                    for link in new_links:
+                        if link not in recorded_links:
+                            recorded_links.add(link)
+                            links_checkpoint.append({"link": link})
+
+                self.scrape_initial_links(url, max_attempts, on_new_links=on_new_links)
+                links_checkpoint.mark_done()
+        except BaseException:
+            link_stream.discard_pending()
+            raise
+        finally:
+            link_stream.close()
+            scrape_thread.join()
+        if "error" in scrape_result:
+            raise scrape_result["error"]
+        scrape_checkpoint.mark_done()
+
+        self.update_output("Scraping completed.")
+        for line in self.wait_stats.summary_lines():
+            self.update_output(line)
+        return scrape_result["content"]
+
+    # Web scraping methods
+    def setup_driver(self):
+        # Launches a new browser, use self.driver_pool to get a warm one
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        chrome_options = Options()
+        # Return from driver.get at DOMContentLoaded, the content itself is awaited explicitly
+        chrome_options.page_load_strategy = "eager"
+        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument(f"user-agent={USER_AGENT}")
+        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        chrome_options.add_experimental_option('useAutomationExtension', False)
+        chrome_options.add_experimental_option("prefs", BLOCKED_CONTENT_PREFERENCES)
+        with self.telemetry.span("browser_launch"):
+            service = Service(resolve_driver_path())
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        block_resources(driver)
+        return driver
+
+    def scrape_initial_links(self, url, max_attempts, on_new_links=None):
+        driver = self.driver_pool.acquire()
+        try:
+            block_resources(driver, GALLERY_BLOCKED_URL_PATTERNS)
+            started = time.monotonic()
+            with self.telemetry.span("driver_get", page="gallery", outcome="ok"):
+                driver.get(url)
+            self.driver_pool.record_page_load(driver, time.monotonic() - started)
+
+            self.update_output("Scrolling and extracting links...")
+            links = self.scroll_and_extract_links(driver, max_attempts=max_attempts, on_new_links=on_new_links)
+            # The browser goes back to the pool, where a scraping worker picks it up warm
+            block_resources(driver)
+        except BaseException:
+            self.driver_pool.discard(driver)
+            raise
+        self.driver_pool.release(driver)
+        return links
+
+    def scroll_and_extract_links(self, driver, min_links=1000, scroll_pause_time=SCROLL_WAIT_TIMEOUT, max_attempts=1, on_new_links=None):
+        # Links are harvested with one script call per scroll that only returns cards not seen before,
+        # new links are handed to on_new_links right away so page scraping can start during scrolling
+        links = []
+        seen_links = set()
+        attempts = 0
+        card_count = driver.execute_script("return document.querySelectorAll('a.prompt-card').length;")
+
+        while len(links) < min_links and attempts < max_attempts:
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            self.wait_for_scroll(driver, card_count, scroll_pause_time)
+
+            card_count, hrefs = driver.execute_script(HARVEST_NEW_CARDS_SCRIPT)
+            new_links = []
+            for href in hrefs:
+                if href and href not in seen_links:
+                    seen_links.add(href)
+                    new_links.append(href)
+            links.extend(new_links)
+            if new_links and on_new_links is not None:
+                on_new_links(new_links)
+
+            self.update_output(f"Scrolled and found {len(links)} unique links so far. Attempt {attempts + 1}/{max_attempts}")
+            self.update_progress((attempts + 1) / max_attempts)
+            attempts += 1
+
+            if len(links) >= min_links:
+                self.update_output(f"Reached the minimum of {min_links} links. Stopping scrolling.")
+                break
+
+        return links
+
+    def wait_for_scroll(self, driver, previous_count, timeout, settle_time=SCROLL_SETTLE_TIME):
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        # Stop waiting as soon as new cards appear or the document height has stopped changing
+        started = time.monotonic()
+        state = {"height": None, "changed_at": started}
+
+        def cards_added_or_settled(driver):
+            count, height = driver.execute_script(
+                "return [document.querySelectorAll('a.prompt-card').length, document.body.scrollHeight];"
+            )
+            now = time.monotonic()
+            if count > previous_count:
+                return "cards"
+            if height != state["height"]:
+                state["height"] = height
+                state["changed_at"] = now
+                return False
+            if now - state["changed_at"] >= settle_time:
+                return "settled"
+            return False
+
+        try:
+            result = WebDriverWait(driver, timeout, poll_frequency=0.25).until(cards_added_or_settled)
+        except TimeoutException:
+            result = "timeout"
+        self.wait_stats.record("Scroll wait", time.monotonic() - started, FIXED_SCROLL_WAIT, timed_out=result == "timeout")
+        self.telemetry.record("webdriver_wait", time.monotonic() - started, wait="scroll", outcome=result)
+        return result
+
+    def scrape_content_from_links(self, links, num_workers=DEFAULT_SCRAPE_WORKERS, scrape_engine=SCRAPE_ENGINE_HTTP, scrape_cache=None):
+        if not links:
+            return []
+        link_stream = LinkStream()
+        link_stream.put_many(links)
+        link_stream.close()
+        return self.scrape_content_from_link_stream(link_stream, num_workers=min(num_workers, len(links)), scrape_engine=scrape_engine, scrape_cache=scrape_cache)
+
+    def scrape_content_from_link_stream(self, link_stream, num_workers=DEFAULT_SCRAPE_WORKERS, scrape_engine=SCRAPE_ENGINE_HTTP, scrape_cache=None, scrape_checkpoint=None, output=None):
+        # Each worker pulls (index, link) pairs from the stream, results are stored by index
+        # so the output keeps the original link order. Checkpointed and cached pages skip the
+        # network entirely; a page that needs the browser borrows a warm one from the driver
+        # pool, which with the HTTP engine only starts browsers once a page needs the fallback.
+        # With an `output` StageQueue the paragraphs are put into it in link order as soon as
+        # every earlier link is done, instead of being returned.
+        num_workers = max(1, num_workers)
+        results = {}
+        state = {"completed": 0, "paragraphs": 0, "checkpoint": 0, "cache": 0, "http": 0, "browser": 0}
+        checkpointed = {}
+        if scrape_checkpoint is not None:
+            checkpointed = {record["link"]: record["paragraphs"] for record in scrape_checkpoint.records}
+        state_lock = threading.Lock()
+        emit_lock = threading.Lock()
+        emitted = [0]
+        fetcher = HttpPromptFetcher(USER_AGENT) if scrape_engine == SCRAPE_ENGINE_HTTP else None
+
+        def emit_ready():
+            # A full output queue blocks the workers here, which holds scraping back until the next stage catches up
+            with emit_lock:
+                while emitted[0] in results:
+                    for paragraph in results.pop(emitted[0]):
+                        output.put(paragraph)
+                    emitted[0] += 1
+
+        def worker(worker_id):
+            try:
+                while True:
+                    if output is not None and output.cancelled:
+                        break
+                    item = link_stream.get()
+                    if item is None:
+                        break
+                    index, link = item
+
+                    self.update_output(f"[Worker {worker_id}] Processing: {link}")
+                    paragraphs = checkpointed.get(link)
+                    engine_used = "checkpoint" if paragraphs is not None else None
+                    if paragraphs is None and scrape_cache is not None:
+                        paragraphs = scrape_cache.get(link)
+                        if paragraphs is not None:
+                            engine_used = "cache"
+
+                    if paragraphs is None and fetcher is not None:
+                        paragraphs = self.fetch_content_from_link(fetcher, link)
+                        if paragraphs is not None:
+                            engine_used = "http"
+
+                    if paragraphs is None:
+                        try:
+                            driver = self.driver_pool.acquire()
+                        except Exception as e:
+                            self.update_output(f"[Worker {worker_id}] Could not start browser: {str(e)}")
+                            link_stream.requeue(item)
+                            return
+                        try:
+                            paragraphs = self.scrape_content_from_link(driver, link)
+                        finally:
+                            self.driver_pool.release(driver)
+                        engine_used = "browser"
+
+                    # Empty results are usually timeouts, so only real content is cached and checkpointed
+                    if scrape_cache is not None and engine_used not in ("checkpoint", "cache") and paragraphs:
+                        scrape_cache.put(link, paragraphs)
+                    if scrape_checkpoint is not None and engine_used != "checkpoint" and paragraphs:
+                        scrape_checkpoint.append({"link": link, "paragraphs": paragraphs})
+                    results[index] = paragraphs
+                    self.telemetry.count("pages_total", engine=engine_used)
+                    if output is not None:
+                        emit_ready()
+
+                    with state_lock:
+                        state["completed"] += 1
+                        state[engine_used] += 1
+                        state["paragraphs"] += len(paragraphs)
+                        completed = state["completed"]
+                        paragraphs_so_far = state["paragraphs"]
+
+                    self.update_output(f"[Worker {worker_id}] Progress: {completed}/{link_stream.count} links completed")
+                    self.update_output(f"Total paragraphs extracted so far: {paragraphs_so_far}")
+                    if link_stream.closed:
+                        # While links are still streaming in the progress bar tracks the scrolling
+                        self.update_progress(completed / link_stream.count)
+            except StageCancelled:
+                pass
+            finally:
+                if fetcher is not None:
+                    fetcher.close()
+
+        workers = [threading.Thread(target=worker, args=(worker_id + 1,), daemon=True) for worker_id in range(num_workers)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        if output is not None:
+            # Pages held back behind a link that was never processed follow in order
+            for index in sorted(results):
+                for paragraph in results.pop(index):
+                    output.put(paragraph)
+        content = []
+        for index in sorted(results):
+            content.extend(results[index])
+        skipped_links = link_stream.count - state["completed"]
+
+        if skipped_links:
+            self.update_output(f"{skipped_links} links were not processed because no browser worker was available")
+        if state["checkpoint"]:
+            self.update_output(f"{state['checkpoint']} links were restored from the run checkpoint")
+        if scrape_cache is not None:
+            self.update_output(f"{state['cache']} links were served from the scrape cache")
+        if fetcher is not None:
+            self.update_output(f"Static HTTP fetch handled {state['http']} links, {state['browser']} fell back to the browser")
+
+        return content
+
+    def fetch_content_from_link(self, fetcher, link):
+        # Returns None when the page has to be rendered in the browser instead
+        with self.telemetry.span("http_fetch", outcome="ok") as span:
+            try:
+                paragraphs = fetcher.fetch_paragraphs(link)
+            except Exception as e:
+                span["outcome"] = "error"
+                self.update_output(f"HTTP fetch failed for {link}, falling back to browser: {str(e)}")
+                return None
+            if paragraphs is None:
+                span["outcome"] = "no_content"
+                self.update_output(f"editorEl not found in static HTML of {link}, falling back to browser")
+            return paragraphs
+
+    def scrape_content_from_link(self, driver, link, page_wait_timeout=PAGE_WAIT_TIMEOUT):
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        try:
+            driver.set_page_load_timeout(5)
+            started = time.monotonic()
+            with self.telemetry.span("driver_get", page="prompt", outcome="ok") as span:
+                try:
+                    driver.get(link)
+                except TimeoutException:
+                    span["outcome"] = "timeout"
+                    self.update_output(f"Page load timed out after 5 seconds for {link}")
+            self.driver_pool.record_page_load(driver, time.monotonic() - started)
+
+            started = time.monotonic()
+            try:
+                WebDriverWait(driver, page_wait_timeout, poll_frequency=0.1).until(
+                    EC.presence_of_element_located((By.ID, "editorEl"))
+                )
+            except TimeoutException:
+                self.wait_stats.record("Page wait", time.monotonic() - started, FIXED_PAGE_WAIT, timed_out=True)
+                self.telemetry.record("webdriver_wait", time.monotonic() - started, wait="page", outcome="timeout")
+                self.update_output(f"Could not find editorEl on {link} within {page_wait_timeout} seconds")
+                return []
+            self.wait_stats.record("Page wait", time.monotonic() - started, FIXED_PAGE_WAIT)
+            self.telemetry.record("webdriver_wait", time.monotonic() - started, wait="page", outcome="found")
+            
+            p_tags = driver.find_elements(By.CSS_SELECTOR, "#editorEl p")
+            return [p.text for p in p_tags]
+        except Exception as e:
+            self.update_output(f"Error extracting content from {link}: {str(e)}")
+            return []
+        finally:
+            driver.set_page_load_timeout(300)
+
+    # CSV formatting method
+    def format_content(self, content, file_name, start_number, file_prefix):
+        """Write the numbered prompt CSV for content and return the number of unique prompts."""
+        count = 0
+        for _ in self.write_formatted_content(self.format_prompts(content, start_number, file_prefix), file_name):
+            count += 1
+        self.update_progress(1)
+        return count
+
+    def format_prompts(self, content, start_number, file_prefix, near_duplicates=True, index=None):
+        # Yields (numbered prompt, file name) for every unique prompt, rewritten by the rewrite rules.
+        # With near_duplicates=False only exact duplicates are dropped, for content that was
+        # deduplicated before variations were generated from it.
+        current_number = start_number
+        rewrite_rules = RewriteRules.load(self.rewrite_rules_file)
+        for prompt in self.unique_prompts(content, near_duplicates, index):
+            updated_prompt, changes = rewrite_rules.rewrite(prompt)
+            for rule_name, old, new in changes:
+                if new:
+                    self.update_output(f"Prompt {current_number} changed: '{old}' to '{new}'")
+                else:
+                    self.update_output(f"Prompt {current_number} changed: removed '{old}' ({rule_name})")
+
+            yield f"{current_number}_{updated_prompt}", f"{file_prefix}V1-{current_number}.jpg"
+            current_number += 1
+
+        for line in rewrite_rules.stats_lines():
+            self.update_output(line)
+
+    def open_prompt_index(self):
+        if self.dedup_threshold is None:
+            return None
+        return NearDuplicateIndex(self.prompt_index_file or ":memory:", threshold=self.dedup_threshold)
+
+    def unique_prompts(self, content, near_duplicates=True, index=None):
+        # Yields every stripped prompt that is not a duplicate. Only a short digest of each prompt is
+        # kept for the exact duplicate check and the near-duplicate index lives on disk, so memory
+        # stays small for very long runs. A given `index` is left to the caller to commit and close,
+        # otherwise one is opened and the prompts become history once all of them have passed.
+        unique_prompts = set()
+        counts = {"exact": 0, "near": 0, "history": 0}
+        own_index = index is None
+        if not near_duplicates:
+            index = None
+        elif own_index:
+            index = self.open_prompt_index()
+
+        try:
+            for prompt in content:
+                prompt = prompt.strip().strip('"')
+                if not prompt:
+                    continue
+                digest = hashlib.blake2b(prompt.lower().encode('utf-8'), digest_size=16).digest()
+                if digest in unique_prompts:
+                    self.update_output(f"Duplicate prompt removed: {prompt}")
+                    counts["exact"] += 1
+                    self.telemetry.count("prompts_dropped_total", reason="exact")
+                    continue
+                unique_prompts.add(digest)
+
+                match = index.check_and_add(prompt) if index is not None else None
+                if match is not None:
+                    similarity, matched_prompt, from_history = match
+                    source = "a prompt from an earlier run" if from_history else "an earlier prompt"
+                    self.update_output(f"Near-duplicate prompt removed ({similarity:.0%} similar to {source}): {prompt} ~ {matched_prompt}")
+                    counts["history" if from_history else "near"] += 1
+                    self.telemetry.count("prompts_dropped_total", reason="history" if from_history else "near")
+                    continue
+
+                yield prompt
+
+            self.update_output(
+                f"Collapsed {sum(counts.values())} duplicate prompts: {counts['exact']} exact, "
+                f"{counts['near']} near-duplicates, {counts['history']} already seen in earlier runs"
+            )
+            if own_index and index is not None:
+                index.commit()
+                self.update_output(index.stats_line())
+        finally:
+            if own_index and index is not None:
+                index.close()
+
+    def write_formatted_content(self, formatted, file_name, flush_every=100):
+        # Writes every pair to the prompt CSV as it passes through, so the file grows while later stages run
+        count = 0
+        with open(file_name, 'w', newline='', encoding='utf-8') as outfile:
+            writer = csv.writer(outfile, quoting=csv.QUOTE_ALL)
+            writer.writerow(["Prompts"])
+            for numbered_prompt, prompt_file_name in formatted:
+                started = time.perf_counter()
+                writer.writerow([numbered_prompt])
+                count += 1
+                if count % flush_every == 0:
+                    outfile.flush()
+                # One span per row would swamp the trace, the rows only go into the histogram
+                self.telemetry.record("csv_write", time.perf_counter() - started, trace=False, file="prompts")
+                yield numbered_prompt, prompt_file_name
+
+        self.update_output(f"Total unique prompts: {count}")
+        self.update_output(f"Process completed. Formatted content saved to {file_name}")
+
+    # Metadata generation methods
+    def stream_variations_response(self, prompts, scheduler):
+        # Prompt n of the batch is sent with id n + 1
+        prompts_str = "\n".join(json.dumps({"id": i + 1, "prompt": prompt}, ensure_ascii=False) for i, prompt in enumerate(prompts))
+
+        return scheduler.stream(VARIATIONS_PROMPT_TEMPLATE.format(prompts_str=prompts_str), VARIATIONS_MODEL, VARIATIONS_GENERATION_CONFIG)
+
+    def process_variations_record(self, record, prompts_by_id):
+        # Returns (source prompt, [parent, variation, ...]) for a valid record, or None
+        try:
+            prompt = prompts_by_id.get(int(record.get("id")))
+        except (TypeError, ValueError):
+            return None
+        variations = record.get("variations")
+        if prompt is None or not isinstance(variations, list):
+            return None
+        variations = [variation.strip() for variation in variations if isinstance(variation, str) and variation.strip()]
+        if not variations:
+            return None
+        parent = record.get("prompt")
+        parent = parent.strip() if isinstance(parent, str) and parent.strip() else prompt
+        return prompt, [parent] + variations[:VARIATIONS_PER_PROMPT - 1]
+
+    def process_variations_response(self, response_string):
+        # Fallback for answers in the old ["..."], ["..."] format, brackets inside the quoted text are kept
+        matches = re.findall(r'\[\s*("(?:[^"\\]|\\.)*")\s*\]', response_string, re.DOTALL)
+        variations = []
+        for item in matches:
+            try:
+                variations.append(json.loads(item).strip())
+            except ValueError:
+                variations.append(item.strip().strip('"'))
+        return variations
+
+    def generate_variations(self, content, scheduler, checkpoint=None, response_cache=None):
+        return scheduler.run(self.generate_variations_async(content, scheduler, checkpoint, response_cache))
+
+    async def generate_variations_async(self, content, scheduler, checkpoint=None, response_cache=None, output=None):
+        # `content` is a list, or a StageQueue that an earlier stage is still filling. Prompts are read in
+        # batches of 3 and the scheduler spreads the batches in flight over the API keys. The variations
+        # keep the order of the prompts and are returned as a list, or put into the `output` StageQueue
+        # batch by batch. Prompts answered in an earlier run come from the response cache and are not sent again.
+        from key_pool import MAX_IN_FLIGHT_PER_KEY, NoUsableKeysError
+
+        memo = ResponseMemo(response_cache, VARIATIONS_PROMPT_TEMPLATE, VARIATIONS_MODEL, VARIATIONS_GENERATION_CONFIG) if response_cache else None
+        total_prompts = len(content) if isinstance(content, list) else None
+        batch_size = 3
+        # Variations generated in an earlier run, keyed by prompt. A resumed scrape may put the prompts in a
+        # different order, e.g. when a page that came back empty before now has content
+        restored = {}
+        if checkpoint is not None:
+            for record in checkpoint.records:
+                # Checkpoints from before variations were keyed by prompt hold batch positions, which cannot be trusted
+                restored.update(record.get("prompts", {}))
+        if restored:
+            self.update_output(f"Restoring variations for {len(restored)} prompts from checkpoint")
+        source = content if isinstance(content, StageQueue) else iter(content)
+        results = {}  # start index -> (batch length, variations) until every earlier batch is passed on
+        varied_content = []
+        state = {"read": 0, "emitted": 0, "completed": 0, "memo_hits": 0, "exhausted": False}
+        read_lock = asyncio.Lock()
+        emit_lock = asyncio.Lock()
+
+        async def read_batch():
+            # Returns the start index and prompts of the next batch, no prompts once the content is exhausted
+            async with read_lock:
+                start = state["read"]
+                batch = []
+                while len(batch) < batch_size and not state["exhausted"]:
+                    if isinstance(source, StageQueue):
+                        item = await source.get_async()
+                    else:
+                        item = next(source, StageQueue.END)
+                    if item is StageQueue.END:
+                        state["exhausted"] = True
+                    else:
+                        batch.append(item)
+                state["read"] += len(batch)
+                return start, batch
+
+        async def emit_ready():
+            async with emit_lock:
+                while state["emitted"] in results:
+                    batch_length, variations = results.pop(state["emitted"])
+                    if output is not None:
+                        for variation in variations:
+                            await output.put_async(variation)
+                    else:
+                        varied_content.extend(variations)
+                    state["emitted"] += batch_length
+
+        async def process_batch(i, batch):
+            batch_label = f"{i+1}-{i+len(batch)}"
+            cached = {prompt: restored[prompt] for prompt in batch if prompt in restored}
+            self.telemetry.count("variations_prompts_total", len(cached), outcome="checkpoint")
+            memo_hits = {}
+            if memo is not None:
+                for prompt in batch:
+                    if prompt not in cached:
+                        variations = memo.get(prompt)
+                        if variations is not None:
+                            memo_hits[prompt] = variations
+            cached.update(memo_hits)
+            missing = [prompt for prompt in batch if prompt not in cached]
+            state["memo_hits"] += len(memo_hits)
+            self.telemetry.count("variations_prompts_total", len(memo_hits), outcome="cache")
+            if memo_hits and checkpoint is not None:
+                checkpoint.append({"prompts": memo_hits})
+            if not missing:
+                return [variation for prompt in batch for variation in cached[prompt]]
+
+            self.update_output(f"Generating variations for prompts {batch_label} of {total_prompts or 'the scraped prompts'}")
+            # Records are used as they stream in, so an error late in the response keeps the earlier prompts
+            prompts_by_id = {n + 1: prompt for n, prompt in enumerate(missing)}
+            parser = JsonRecordParser()
+            raw = []
+            generated = {}
+            with self.telemetry.span("gemini_batch", stage="variations", batch_size=len(missing), attempt=1) as span:
+                try:
+                    async for record in stream_records(self.stream_variations_response(missing, scheduler), parser, raw):
+                        parsed = self.process_variations_record(record, prompts_by_id)
+                        if parsed is None:
+                            continue
+                        prompt, variations = parsed
+                        generated[prompt] = variations
+                        if memo is not None and len(variations) == VARIATIONS_PER_PROMPT:
+                            memo.put(prompt, variations)
+                except NoUsableKeysError:
+                    raise
+                except Exception as e:
+                    self.update_output(f"Error generating variations for prompts {batch_label}: {str(e)}")
+
+                if not parser.records and raw:
+                    variations = self.process_variations_response("".join(raw))
+                    if len(variations) == VARIATIONS_PER_PROMPT * len(missing):
+                        for n, prompt in enumerate(missing):
+                            generated[prompt] = variations[n * VARIATIONS_PER_PROMPT:(n + 1) * VARIATIONS_PER_PROMPT]
+                span["outcome"] = "complete" if len(generated) == len(missing) else "partial" if generated else "failed"
+            self.telemetry.record("parse_response", parser.seconds, stage="variations")
+            self.telemetry.count("variations_prompts_total", len(generated), outcome="model")
+            self.telemetry.count("variations_prompts_total", len(missing) - len(generated), outcome="original")
+            if not generated:
+                self.update_output(f"Failed to generate variations for prompts {batch_label}")
+            elif len(generated) < len(missing):
+                self.update_output(f"No variations for {len(missing) - len(generated)} prompts in {batch_label}, keeping the original prompts")
+
+            # Prompts without variations keep just the original prompt, like a failed batch always did
+            variations = [variation for prompt in batch for variation in (cached.get(prompt) or generated.get(prompt) or [prompt])]
+            if generated and checkpoint is not None:
+                checkpoint.append({"prompts": generated})
+            return variations
+
+        async def worker():
+            while True:
+                i, batch = await read_batch()
+                if not batch:
+                    return
+                variations = await process_batch(i, batch)
+                results[i] = (len(batch), variations)
+                state["completed"] += 1
+                if total_prompts:
+                    self.update_progress(state["completed"] / -(-total_prompts // batch_size))
+                await emit_ready()
+
+        num_workers = len(scheduler.pool.keys) * MAX_IN_FLIGHT_PER_KEY
+        await asyncio.gather(*(worker() for _ in range(num_workers)))
+        if state["memo_hits"]:
+            self.update_output(f"Variations for {state['memo_hits']} prompts were served from the response cache")
+        return varied_content
+
+    def process_metadata_record(self, record):
+        # Returns (serial, [title, keywords, prompt, model]) for a valid record, or None
+        serial_match = re.search(r'\d+', str(record.get("id", "")))
+        title = record.get("title")
+        keywords = record.get("keywords")
+        prompt = record.get("prompt")
+        model = record.get("model") or METADATA_MODEL_NAME
+        if isinstance(keywords, str):
+            keywords = keywords.split(',')
+        if not serial_match or not isinstance(keywords, list):
+            return None
+        keywords = [str(keyword).strip() for keyword in keywords if str(keyword).strip()]
+        if not keywords or not all(isinstance(value, str) and value.strip() for value in (title, prompt, model)):
+            return None
+        return serial_match.group(), [title.strip(), ','.join(keywords), prompt.strip(), model.strip()]
+
+    def process_metadata(self, metadata_string):
+        # Fallback for answers in the old "Serial;Title;Keywords;Prompt;Model" format.
+        # Returns {serial: [title, keywords, prompt, model]} so every row can be matched to its source prompt
+        entries = metadata_string.strip().split('\n')
+        processed_entries = {}
+        for entry in entries:
+            entry = entry.strip().strip('"')
+            components = entry.split(';')
+            if len(components) >= 5:
+                # Only the prompt may contain semicolons of its own
+                serial, title, keywords = components[:3]
+                prompt = ';'.join(components[3:-1])
+                model = components[-1]
+                serial_match = re.search(r'\d+', serial)
+                if not serial_match:
+                    continue
+                # Ensure keywords are comma-separated
+                keywords = ','.join(keyword.strip() for keyword in keywords.split(','))
+                processed_entries[serial_match.group()] = [title, keywords, prompt, model]
+        return processed_entries
+
+    def prompt_serial(self, formatted_prompt):
+        # Formatted prompts look like "<serial>_<prompt>"
+        match = re.match(r'(\d+)_', formatted_prompt)
+        return match.group(1) if match else None
+
+    def prompt_text(self, formatted_prompt):
+        return re.sub(r'^\d+_', '', formatted_prompt, count=1)
+
+    def metadata_key(self, formatted_prompt):
+        # Metadata checkpoints key rows by the prompt text, the serial number can change on resume
+        return hashlib.blake2b(self.prompt_text(formatted_prompt).encode('utf-8'), digest_size=16).hexdigest()
+
+    def generate_metadata(self, formatted, scheduler, file_prefix, checkpoint=None, response_cache=None, total_prompts=None):
+        scheduler.run(self.generate_metadata_async(formatted, scheduler, file_prefix, checkpoint, response_cache, total_prompts))
+
+    async def generate_metadata_async(self, formatted, scheduler, file_prefix, checkpoint=None, response_cache=None, total_prompts=None):
+        # `formatted` is an iterable of (numbered prompt, file name) pairs that is consumed lazily, or a
+        # StageQueue the format stage is still filling, then each pull only takes the pairs that are ready.
+        # Prompts are pulled in batches whose size adapts to how well the model keeps up. Every
+        # returned row is matched back to its prompt by serial number, valid rows are kept and
+        # only the missing prompts go back into the queue. Finished rows are written to all
+        # output files in prompt order, so only the prompts in flight are held in memory.
+        from gemini_client import AdaptiveBatchSizer
+        from key_pool import MAX_IN_FLIGHT_PER_KEY, NoUsableKeysError
+
+        max_retries = 3
+        # Rows that succeeded in an earlier run, keyed by prompt text. A resumed run may format the
+        # prompts into a different order, e.g. when a page or variation batch that failed before now succeeds
+        restored = {}
+        if checkpoint is not None:
+            for record in checkpoint.records:
+                for key, row in record["rows"]:
+                    # Checkpoints from before rows were keyed by text hold positions, which cannot be trusted
+                    if isinstance(key, str):
+                        restored[key] = row
+        if restored:
+            self.update_output(f"Restoring metadata for {len(restored)} prompts from checkpoint")
+
+        # Prompts answered in an earlier run come from the response cache, keyed without their serial number
+        memo = ResponseMemo(response_cache, METADATA_PROMPT_TEMPLATE, METADATA_MODEL, METADATA_GENERATION_CONFIG) if response_cache else None
+
+        source = formatted if isinstance(formatted, StageQueue) else iter(formatted)
+        items = {}  # index -> (prompt, file name) until the prompt's row is written
+        finished = {}  # index -> row, or None for a skipped prompt, until every earlier prompt is finished
+        pending = collections.deque()
+        attempts = collections.Counter()
+        sizer = AdaptiveBatchSizer()
+        counts = {"pulled": 0, "written": 0, "processed": 0, "memo": 0, "skipped": 0, "retries": 0, "invalid": 0, "calls": 0, "in_flight": 0}
+        state = {"exhausted": False, "starved": False}
+        writer = MetadataWriter(file_prefix)
+
+        def finish(index, row):
+            finished[index] = row
+            if row is not None:
+                counts["processed"] += 1
+            while counts["written"] in finished:
+                next_row = finished.pop(counts["written"])
+                prompt, prompt_file_name = items.pop(counts["written"])
+                if next_row is not None:
+                    started = time.perf_counter()
+                    reduced = writer.write(prompt_file_name, next_row)
+                    self.telemetry.record("csv_write", time.perf_counter() - started, trace=False, file="metadata")
+                    if reduced:
+                        self.update_output(f"Prompt {self.prompt_serial(prompt)} has more than {MAX_KEYWORDS} keywords, the reduced files keep the first {MAX_KEYWORDS}")
+                counts["written"] += 1
+
+        def pull(limit):
+            # Take up to `limit` new prompts from the source, prompts with a known answer are finished right away
+            batch = []
+            memo_hits = []
+            state["starved"] = False
+            while len(batch) < limit and not state["exhausted"] and counts["pulled"] - counts["written"] < METADATA_REORDER_WINDOW:
+                item = source.poll() if isinstance(source, StageQueue) else next(source, StageQueue.END)
+                if item is StageQueue.NOT_READY:
+                    state["starved"] = True
+                    break
+                if item is StageQueue.END:
+                    state["exhausted"] = True
+                    break
+                index = counts["pulled"]
+                counts["pulled"] += 1
+                items[index] = item
+                row = restored.get(self.metadata_key(item[0]))
+                if row is not None:
+                    self.telemetry.count("metadata_prompts_total", outcome="checkpoint")
+                elif memo is not None:
+                    row = memo.get(self.prompt_text(item[0]))
+                    if row is not None:
+                        memo_hits.append([self.metadata_key(item[0]), row])
+                        self.telemetry.count("metadata_prompts_total", outcome="cache")
+                if row is not None:
+                    finish(index, row)
+                else:
+                    batch.append(index)
+            if memo_hits:
+                counts["memo"] += len(memo_hits)
+                if checkpoint is not None:
+                    checkpoint.append({"rows": memo_hits})
+            return batch
+
+        def report_progress():
+            total = total_prompts
+            if total is None and isinstance(source, StageQueue) and source.closed:
+                total = source.count
+            self.update_output(f"Processed {counts['processed']} prompts out of {total or counts['pulled']}.")
+            if total:
+                self.update_progress(min(1.0, counts["written"] / total))
+
+        async def worker():
+            while True:
+                batch = [pending.popleft() for _ in range(min(sizer.size, len(pending)))]
+                if len(batch) < sizer.size:
+                    batch += pull(sizer.size - len(batch))
+                if batch and len(batch) < sizer.size and state["starved"]:
+                    # More prompts are on the way, wait for a full batch instead of spending a call on a few
+                    pending.extendleft(reversed(batch))
+                    batch = []
+                if not batch:
+                    if state["exhausted"] and not pending and counts["in_flight"] == 0:
+                        return
+                    # Another worker may still put missing prompts back
+                    await asyncio.sleep(0.05)
+                    continue
+
+                counts["in_flight"] += 1
+                counts["calls"] += 1
+                self.update_output(f"Processing batch of {len(batch)} prompts...")
+                started = time.monotonic()
+                # Every valid record is matched to its prompt and written out while the rest of the
+                # response is still streaming; whatever has not arrived when the call ends is retried.
+                # Prompt n of the batch is sent with id n + 1, serials from the input need not be unique
+                unanswered = {str(n + 1): index for n, index in enumerate(batch)}
+                batch_prompts = [(batch_id, self.prompt_text(items[index][0])) for batch_id, index in unanswered.items()]
+                salvaged = []
+
+                def accept(serial, row):
+                    index = unanswered.pop(serial, None)
+                    if index is None:
+                        counts["invalid"] += 1
+                        return
+                    salvaged.append([index, row])
+                    self.telemetry.count("metadata_prompts_total", outcome="model")
+                    if memo is not None:
+                        memo.put(self.prompt_text(items[index][0]), row)
+                    if checkpoint is not None:
+                        checkpoint.append({"rows": [[self.metadata_key(items[index][0]), row]]})
+                    attempts.pop(index, None)
+                    finish(index, row)
+
+                parser = JsonRecordParser()
+                raw = []
+                invalid_before = counts["invalid"]
+                attempt = max(attempts[index] for index in batch) + 1
+                with self.telemetry.span("gemini_batch", stage="metadata", batch_size=len(batch), attempt=attempt) as span:
+                    try:
+                        async for record in stream_records(self.stream_metadata_response(batch_prompts, scheduler), parser, raw):
+                            parsed = self.process_metadata_record(record)
+                            if parsed is not None:
+                                accept(*parsed)
+                            else:
+                                counts["invalid"] += 1
+                    except NoUsableKeysError:
+                        # Retrying cannot help, the run stops and the other stages are cancelled
+                        raise
+                    except Exception as e:
+                        self.update_output(f"Error processing batch: {str(e)}")
+                    logger.debug("".join(raw))
+                    if not parser.records and raw:
+                        for serial, row in self.process_metadata("".join(raw)).items():
+                            accept(serial, row)
+                    span["outcome"] = "complete" if not unanswered else "partial" if salvaged else "failed"
+                self.telemetry.record("parse_response", parser.seconds, stage="metadata")
+                counts["invalid"] += parser.errors
+                self.telemetry.count("metadata_invalid_records_total", counts["invalid"] - invalid_before)
+
+                missing = list(unanswered.values())
+                sizer.record(len(batch), len(salvaged), time.monotonic() - started)
+
+                for index in missing:
+                    attempts[index] += 1
+                    if attempts[index] < max_retries:
+                        pending.append(index)
+                        counts["retries"] += 1
+                        self.telemetry.count("metadata_retries_total")
+                    else:
+                        self.update_output(f"Max retries reached. Skipping prompt: {items[index][0]}")
+                        counts["skipped"] += 1
+                        self.telemetry.count("metadata_prompts_total", outcome="skipped")
+                        del attempts[index]
+                        finish(index, None)
+                if missing:
+                    self.update_output(f"Received {len(salvaged)} of {len(batch)} rows, re-requesting the missing prompts. Batch size is now {sizer.size}")
+                else:
+                    self.update_output(f"Metadata for {len(salvaged)} prompts processed")
+                counts["in_flight"] -= 1
+                report_progress()
+
+        try:
+            num_workers = len(scheduler.pool.keys) * MAX_IN_FLIGHT_PER_KEY
+            await asyncio.gather(*(worker() for _ in range(num_workers)))
+        finally:
+            writer.close()
+
+        if counts["memo"]:
+            self.update_output(f"Metadata for {counts['memo']} prompts was served from the response cache")
+        for version, output_file, reduced_output_file in writer.paths:
+            self.update_output(f"Generated metadata files for {version}: {output_file} and {reduced_output_file}")
+        if writer.reduced_rows:
+            self.update_output(f"Keywords were reduced to {MAX_KEYWORDS} for {writer.reduced_rows} prompts in the reduced files")
+
+        self.update_output("\nMetadata generation completed. Summary report:")
+        self.update_output(f"Total prompts: {counts['pulled']}")
+        self.update_output(f"Successfully processed: {counts['processed']}")
+        self.update_output(f"Skipped: {counts['skipped']}")
+        self.update_output(f"Total retry attempts: {counts['retries']}")
+        self.update_output(f"Invalid or unmatched records in responses: {counts['invalid']}")
+        calls_per_prompt = counts["calls"] / counts["processed"] if counts["processed"] else 0
+        self.update_output(f"Model calls: {counts['calls']} ({calls_per_prompt:.2f} per prompt), final batch size {sizer.size}, largest {sizer.peak}")
+        if response_cache is not None:
+            self.update_output(response_cache.stats_line("Gemini response cache"))
+        self.update_output("API key stats:")
+        for line in scheduler.summary_lines():
+            self.update_output(line)
+
+    def stream_metadata_response(self, prompts, scheduler):
+        # `prompts` are (id, prompt text) pairs, the id lets answers be matched in any order
+        prompts_str = "\n".join(json.dumps({"id": serial, "prompt": prompt}, ensure_ascii=False) for serial, prompt in prompts)
+
+        return scheduler.stream(METADATA_PROMPT_TEMPLATE.format(count=len(prompts), prompts_str=prompts_str), METADATA_MODEL, METADATA_GENERATION_CONFIG)
@@ -0,0 +1,150 @@
+"""Prompt rewrite rules, compiled into one regular expression that is applied in a single pass.
+
+The rules file is a JSON list. Each rule has a "name" and is either a parameter rule or a term rule:
+
+    {"name": "version", "parameter": "v", "value_pattern": "\\d+(?:\\.\\d+)?", "set": "6.1"}
+    {"name": "aspect ratio", "parameter": "ar", "set": "16:9"}
+    {"name": "no style", "parameter": "style", "remove": true}
+    {"name": "banned terms", "terms": ["trending on artstation", "unreal engine"]}
+    {"name": "brand", "terms": ["midjourney"], "replace": "AI"}
+
+Parameter rules match "--<parameter> <value>", optionally restricted by "value_pattern", and
+either replace the value or remove the parameter. Term rules match whole words or phrases,
+case-insensitively, and remove them unless "replace" is given.
+"""
+import json
+import os
+import re
+
+DEFAULT_RULES = [
+    {"name": "version", "parameter": "v", "value_pattern": r"\d+(?:\.\d+)?", "set": "6.1"},
+]
+DEFAULT_VALUE_PATTERN = r"[^\s,-][^\s,]*"
+# Whitespace and an optional comma after removed text
+SEPARATOR_PATTERN = re.compile(r"\s*(,\s*)?")
+
+
+class RewriteRules:
+    """Applies every rewrite rule to a prompt with one scan and counts hits per rule.
+
+    All rules are compiled into a single alternation; parameter rules share the "--" prefix
+    and a lookahead on the possible first characters lets the scanner skip most positions
+    cheaply. Matching is case-insensitive: the scan runs over the lowercased prompt, so value
+    patterns should be written for lower case text.
+    """
+
+    def __init__(self, rules):
+        self.rules = []
+        self.replacements = []
+        self.hits = {}
+        parameter_alternatives = []
+        term_alternatives = []
+        first_chars = set()
+        for index, rule in enumerate(rules):
+            name = rule.get("name") or f"rule {index + 1}"
+            # The group name is the rule's position, match.lastgroup tells which rule matched
+            group = f"r{len(self.rules)}"
+            if "parameter" in rule:
+                parameter = rule["parameter"].lower()
+                value_pattern = rule.get("value_pattern", DEFAULT_VALUE_PATTERN)
+                if rule.get("remove"):
+                    pattern = rf"{re.escape(parameter)}(?:\s+(?:{value_pattern}))?(?![\w.:-])"
+                    replacement = ""
+                elif "set" in rule:
+                    pattern = rf"{re.escape(parameter)}\s+(?:{value_pattern})(?![\w.:-])"
+                    replacement = f"--{parameter} {rule['set']}"
+                else:
+                    raise ValueError(f"Parameter rule '{name}' needs \"set\" or \"remove\"")
+                parameter_alternatives.append(f"(?P<{group}>{pattern})")
+                first_chars.add("-")
+            elif "terms" in rule:
+                terms = sorted({term.lower().strip() for term in rule["terms"] if term.strip()}, key=len, reverse=True)
+                if not terms:
+                    continue
+                pattern = "|".join(r"\s+".join(map(re.escape, term.split())) for term in terms)
+                term_alternatives.append(f"(?P<{group}>{pattern})")
+                first_chars.update(term[0] for term in terms)
+                replacement = rule.get("replace", "")
+            else:
+                raise ValueError(f"Rule '{name}' needs \"parameter\" or \"terms\"")
+            self.rules.append(name)
+            self.replacements.append(replacement)
+            self.hits[name] = 0
+
+        alternatives = []
+        if parameter_alternatives:
+            alternatives.append("--(?:" + "|".join(parameter_alternatives) + ")")
+        if term_alternatives:
+            alternatives.append(r"(?<!\w)(?:" + "|".join(term_alternatives) + r")(?!\w)")
+        self.scanner = None
+        self.fallback_scanner = None
+        if alternatives:
+            pattern = "(?=[" + "".join(re.escape(char) for char in sorted(first_chars)) + "])(?:" + "|".join(alternatives) + ")"
+            self.scanner = re.compile(pattern)
+            # For the rare prompts whose length changes when lowercased, so spans would not line up
+            self.fallback_scanner = re.compile(pattern, re.IGNORECASE)
+
+    @classmethod
+    def load(cls, path):
+        """Load rules from a JSON file, or use DEFAULT_RULES when the file does not exist."""
+        if path is None or not os.path.exists(path):
+            return cls(DEFAULT_RULES)
+        with open(path, "r", encoding="utf-8") as file:
+            return cls(json.load(file))
+
+    def rewrite(self, prompt):
+        """Return the rewritten prompt and a list of (rule name, old text, new text) for every change."""
+        if self.scanner is None:
+            return prompt, []
+        lowered = prompt.lower()
+        if len(lowered) == len(prompt):
+            matches = self.scanner.finditer(lowered)
+        else:
+            matches = self.fallback_scanner.finditer(prompt)
+
+        changes = []
+        pieces = []
+        position = 0
+        for match in matches:
+            rule = int(match.lastgroup[1:])
+            start, end = match.span()
+            old = prompt[start:end]
+            new = self.replacements[rule]
+            if old == new:
+                continue
+            name = self.rules[rule]
+            self.hits[name] += 1
+            changes.append((name, old, new))
+            if new:
+                pieces.append(prompt[position:start])
+                pieces.append(new)
+                position = end
+                continue
+
+            # Removed text takes its surrounding whitespace and, if needed, one comma with it,
+            # so "a, banned, b" becomes "a, b" and nothing dangles at either end
+            segment = prompt[position:start].rstrip()
+            position = SEPARATOR_PATTERN.match(prompt, end).end()
+            has_comma = prompt[end:position].strip() == ","
+            previous = segment or (pieces[-1] if pieces else "")
+            if position == len(prompt):
+                if segment:
+                    pieces.append(segment.rstrip(",").rstrip())
+                elif pieces:
+                    pieces[-1] = pieces[-1].rstrip().rstrip(",").rstrip()
+            elif previous:
+                if previous[-1].isspace():
+                    separator = ""
+                elif has_comma and previous[-1] != ",":
+                    separator = ", "
+                else:
+                    separator = " "
+                pieces.append(segment + separator)
+        if not changes:
+            return prompt, changes
+
+        pieces.append(prompt[position:])
+        return "".join(pieces), changes
+
+    def stats_lines(self):
+        return [f"Rewrite rule '{name}': {hits} rewrites" for name, hits in self.hits.items()]
@@ -0,0 +1,106 @@
+import json
+import re
+import time
+
+# Characters that matter inside a JSON string, and between the tokens of an object
+STRING_SPECIAL = re.compile(r'["\\]')
+OBJECT_SPECIAL = re.compile(r'[{}"]')
+
+
+class JsonRecordParser:
+    """Incremental parser that pulls complete JSON objects out of streamed model output.
+
+    Handles a JSON array of objects, JSON lines, or either wrapped in a Markdown code fence:
+    anything outside the top-level objects is skipped. `feed` returns the objects completed by
+    the new text, so each record can be used while the rest of the response is still arriving.
+    An object that is not valid JSON is counted in `errors` and parsing continues after it.
+    The time spent in `feed` adds up in `seconds`.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.start = None
+        self.depth = 0
+        self.in_string = False
+        self.records = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def feed(self, text):
+        started = time.perf_counter()
+        try:
+            return self._feed(text)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def _feed(self, text):
+        self.buffer += text
+        completed = []
+        while True:
+            if self.depth == 0:
+                start = self.buffer.find("{", self.position)
+                if start < 0:
+                    # Nothing but separators or prose so far, there is no need to keep it
+                    self.buffer = ""
+                    self.position = 0
+                    return completed
+                self.start = start
+                self.depth = 1
+                self.position = start + 1
+                continue
+
+            pattern = STRING_SPECIAL if self.in_string else OBJECT_SPECIAL
+            match = pattern.search(self.buffer, self.position)
+            if match is None:
+                # Stays past the end when the chunk ended on a backslash
+                self.position = max(self.position, len(self.buffer))
+                return completed
+            char = match.group()
+            self.position = match.end()
+            if char == "\\":
+                # Skip the escaped character, even if it only arrives with the next chunk
+                self.position += 1
+            elif char == '"':
+                self.in_string = not self.in_string
+            elif char == "{":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    completed.extend(self._decode(self.buffer[self.start:self.position]))
+                    self.buffer = self.buffer[self.position:]
+                    self.position = 0
+                    self.start = None
+
+    def _decode(self, text):
+        try:
+            record = json.loads(text)
+        except ValueError:
+            self.errors += 1
+            return []
+        # A wrapper such as {"results": [{...}, {...}]} holds the records in its only list
+        if isinstance(record, dict) and "id" not in record:
+            lists = [value for value in record.values() if isinstance(value, list)]
+            if len(lists) == 1 and all(isinstance(item, dict) for item in lists[0]):
+                self.records += len(lists[0])
+                return lists[0]
+        self.records += 1
+        return [record]
+
+    @property
+    def incomplete(self):
+        """True if the text fed so far ends inside an object."""
+        return self.depth > 0
+
+
+async def stream_records(chunks, parser, raw=None):
+    """Yield every complete record from an async iterable of text chunks as soon as it is parsed.
+
+    The chunks are also appended to the `raw` list if one is given.
+    """
+    async for chunk in chunks:
+        if raw is not None:
+            raw.append(chunk)
+        for record in parser.feed(chunk):
+            yield record
@@ -0,0 +1,152 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRIC_PREFIX = "gate2ai_"
+# Upper bounds in seconds of the histogram buckets every span is counted in
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def escape_label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(items, extra=()):
+    items = list(items) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in items) + "}"
+
+
+class Telemetry:
+    """Timing spans and counters with labels, safe to use from any thread or coroutine.
+
+    Every span is appended to `trace_file` as one JSON line with its start time, duration and
+    labels, unless it is recorded with trace=False, and counted in a histogram per span name and
+    label set. Histograms and counters are written to `metrics_file` in the Prometheus text format
+    every `export_interval` seconds and on `close`; the file is replaced atomically, so it can be
+    picked up by a node_exporter textfile collector while a run is going. Without files the
+    numbers are only kept in memory for `summary_lines`.
+    """
+
+    def __init__(self, trace_file=None, metrics_file=None, export_interval=15.0):
+        self.trace_file = trace_file
+        self.metrics_file = metrics_file
+        self.export_interval = export_interval
+        self.lock = threading.Lock()
+        self.export_lock = threading.Lock()
+        self.trace = open(trace_file, "a", encoding="utf-8") if trace_file else None
+        self.histograms = {}  # (name, labels) -> [count per bucket, count, sum]
+        self.counters = {}  # (name, labels) -> value
+        self.last_export = time.monotonic()
+
+    def record(self, name, seconds, trace=True, **labels):
+        """Record a span of `seconds` that ended just now."""
+        key = (name, label_key(labels))
+        line = None
+        if trace and self.trace is not None:
+            line = json.dumps({"span": name, "start": round(time.time() - seconds, 6), "seconds": round(seconds, 6), **labels}, ensure_ascii=False)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(SPAN_BUCKETS), 0, 0.0]
+            bucket = bisect.bisect_left(SPAN_BUCKETS, seconds)
+            if bucket < len(SPAN_BUCKETS):
+                histogram[0][bucket] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+            if line is not None and self.trace is not None:
+                self.trace.write(line + "\n")
+        self._export_if_due()
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time the block as a span. The labels dict is yielded, so the block can add labels such as an outcome."""
+        started = time.perf_counter()
+        try:
+            yield labels
+        except BaseException:
+            labels["outcome"] = "error"
+            raise
+        finally:
+            self.record(name, time.perf_counter() - started, **labels)
+
+    def count(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._export_if_due()
+
+    def _export_if_due(self):
+        if self.metrics_file is None:
+            return
+        with self.lock:
+            due = time.monotonic() - self.last_export >= self.export_interval
+            if due:
+                self.last_export = time.monotonic()
+        if due:
+            self.export()
+
+    def prometheus_text(self):
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        declared = set()
+        for (name, labels), (buckets, count, total) in histograms:
+            metric = f"{METRIC_PREFIX}{name}_seconds"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(SPAN_BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{format_labels(labels, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{metric}_bucket{format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}{name}"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        with self.lock:
+            self.last_export = time.monotonic()
+            if self.trace is not None:
+                self.trace.flush()
+        if self.metrics_file is None:
+            return
+        temporary_file = f"{self.metrics_file}.tmp"
+        with self.export_lock:
+            with open(temporary_file, "w", encoding="utf-8") as file:
+                file.write(self.prometheus_text())
+            os.replace(temporary_file, self.metrics_file)
+
+    def summary_lines(self, limit=10):
+        """The spans that took the most time in total, summed over their labels."""
+        totals = {}
+        with self.lock:
+            for (name, _), (_, count, total) in self.histograms.items():
+                entry = totals.setdefault(name, [0, 0.0])
+                entry[0] += count
+                entry[1] += total
+        ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [f"{name}: {count} spans, {total:.1f}s total, {total / count:.3f}s avg" for name, (count, total) in ranked]
+
+    def close(self):
+        self.export()
+        with self.lock:
+            if self.trace is not None:
+                self.trace.close()
+                self.trace = None
@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live at the top of the repository, the Gemini stub and fixture site under benchmarks/
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
@@ -0,0 +1,49 @@
+import json
+import os
+
+import pytest
+
+from checkpoint import RunCheckpoint
+
+PARAMS = {"url": "http://gallery/1", "start_number": 1, "generate_variations": False}
+
+
+def read_params(run_dir):
+    with open(os.path.join(run_dir, "run.json"), encoding="utf-8") as file:
+        return json.load(file)
+
+
+def test_resume_keeps_the_records_and_run_json(tmp_path):
+    run_dir = str(tmp_path / "run")
+    checkpoint = RunCheckpoint(run_dir, params=PARAMS)
+    checkpoint.stage("format").append({"prompt": "1_a cat"})
+    checkpoint.close()
+
+    checkpoint = RunCheckpoint(run_dir, resume=True, params=dict(PARAMS))
+
+    assert checkpoint.stage("format").records == [{"prompt": "1_a cat"}]
+    assert read_params(run_dir) == PARAMS
+    checkpoint.close()
+
+
+def test_resume_with_other_settings_is_refused(tmp_path):
+    run_dir = str(tmp_path / "run")
+    checkpoint = RunCheckpoint(run_dir, params=PARAMS)
+    checkpoint.stage("format").append({"prompt": "1_a cat"})
+    checkpoint.close()
+
+    with pytest.raises(ValueError, match="start_number 1 -> 5"):
+        RunCheckpoint(run_dir, resume=True, params=dict(PARAMS, start_number=5))
+
+    assert read_params(run_dir) == PARAMS
+    assert RunCheckpoint(run_dir, resume=True, params=PARAMS).stage("format").records == [{"prompt": "1_a cat"}]
+
+
+def test_new_run_moves_the_old_one_aside(tmp_path):
+    run_dir = str(tmp_path / "run")
+    RunCheckpoint(run_dir, params=PARAMS).close()
+
+    RunCheckpoint(run_dir, params=dict(PARAMS, start_number=5)).close()
+
+    assert read_params(run_dir)["start_number"] == 5
+    assert len(os.listdir(tmp_path)) == 2
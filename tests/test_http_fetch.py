@@ -0,0 +1,56 @@
+import pytest
+
+from fixture_server import FixtureServer, prompt_text
+from http_fetch import EditorParagraphParser, HttpPromptFetcher
+
+PAGE = """<html><body>
+<p>before the editor</p>
+<div id="editorEl">
+  <p>first   <b>bold</b>
+     prompt</p>
+  <div><p>nested<br>second line</p></div>
+  <img src="x.png">
+</div>
+<p>after the editor</p>
+</body></html>"""
+
+
+def parse(html, chunk_size=None):
+    parser = EditorParagraphParser()
+    chunk_size = chunk_size or len(html)
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+    parser.close()
+    return parser
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 13])
+def test_paragraphs_inside_the_editor(chunk_size):
+    parser = parse(PAGE, chunk_size)
+
+    assert parser.found
+    assert parser.done
+    assert parser.paragraphs == ["first bold prompt", "nested\nsecond line"]
+
+
+def test_page_without_editor():
+    parser = parse("<html><body><p>no editor here</p></body></html>")
+
+    assert not parser.found
+    assert parser.paragraphs == []
+
+
+def test_character_references_are_decoded():
+    assert parse('<div id="editorEl"><p>fish &amp; chips &quot;hot&quot;</p></div>').paragraphs == ['fish & chips "hot"']
+
+
+def test_fetcher_reads_prompt_pages_from_the_fixture_site():
+    with FixtureServer(num_prompts=3, page_delay=0, js_every=3) as server:
+        fetcher = HttpPromptFetcher("test-agent")
+        try:
+            results = [fetcher.fetch_paragraphs(link) for link in server.prompt_links()]
+        finally:
+            fetcher.close()
+
+    # Every third page, starting with the first, builds #editorEl with JavaScript, so it is not in the static HTML
+    assert results == [None, [prompt_text(1)], [prompt_text(2)]]
@@ -0,0 +1,145 @@
+import csv
+
+import pytest
+
+pytest.importorskip("google.api_core")
+
+from google.api_core import exceptions
+
+from checkpoint import RunCheckpoint
+from fixture_server import FixtureServer
+from gemini_client import GeminiScheduler
+from gemini_stub import StubGemini
+from key_pool import NoUsableKeysError
+from pipeline import PromptPipeline
+
+FILE_PREFIX = "G"
+
+
+class TruncateFirstAnswer(StubGemini):
+    """Cuts off the first answer, every later one is complete."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.damaged = False
+        self.prompts_sent = 0
+
+    def answer(self, prompt):
+        text = super().answer(prompt)
+        self.prompts_sent += prompt.count('{"id": ')
+        if not self.damaged:
+            self.damaged = True
+            return text[:len(text) * 2 // 3]
+        return text
+
+
+class InvalidKeyModel:
+    async def generate_content_async(self, prompt, stream=False):
+        raise exceptions.PermissionDenied("API key not valid")
+
+
+class FixturePipeline(PromptPipeline):
+    """Runs every stage against the fixture site with the given model, the gallery scroll is skipped."""
+
+    def __init__(self, links, model_factory):
+        super().__init__(prompt_index_file="history.sqlite3")
+        self.links = links
+        self.model_factory = model_factory
+
+    def create_scheduler(self, api_keys):
+        return GeminiScheduler(api_keys, model_factory=self.model_factory, telemetry=self.telemetry)
+
+    def scrape_initial_links(self, url, max_attempts, on_new_links=None):
+        on_new_links(self.links)
+        return self.links
+
+
+def formatted_pairs(prompts, serials=None):
+    serials = serials or range(1, len(prompts) + 1)
+    return [(f"{serial}_{prompt}", f"{FILE_PREFIX}V1-{n + 1}.jpg") for n, (serial, prompt) in enumerate(zip(serials, prompts))]
+
+
+def generate(formatted, model_factory, checkpoint=None):
+    pipeline = PromptPipeline(prompt_index_file=None)
+    scheduler = GeminiScheduler(["key"], model_factory=model_factory)
+    pipeline.generate_metadata(formatted, scheduler, FILE_PREFIX, checkpoint=checkpoint)
+    with open(f"{FILE_PREFIX}-md-V1.csv", newline="", encoding="utf-8") as file:
+        rows = list(csv.reader(file, delimiter=";"))[1:]
+    # The stub titles every prompt with its first 4 words
+    return [(file_name, title) for file_name, title, *_ in rows]
+
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_rows_are_written_in_prompt_order():
+    prompts = [f"prompt number {n}" for n in range(40)]
+    stub = StubGemini(latency=0.01, jitter=0.9)
+
+    rows = generate(formatted_pairs(prompts), stub.model_factory)
+
+    assert rows == [(f"{FILE_PREFIX}V1-{n + 1}.jpg", prompt) for n, prompt in enumerate(prompts)]
+
+
+def test_prompts_sharing_a_serial_get_their_own_rows():
+    prompts = ["fox at sea", "cat at sea", "owl at sea", "dog at sea", "bee at sea"]
+
+    rows = generate(formatted_pairs(prompts, serials=[1, 2, 1, 3, 4]), StubGemini(latency=0.01).model_factory)
+
+    assert [title for _, title in rows] == prompts
+
+
+def test_cut_off_answer_keeps_the_received_rows_and_retries_the_rest():
+    prompts = [f"prompt number {n}" for n in range(12)]
+    stub = TruncateFirstAnswer(latency=0.01)
+
+    rows = generate(formatted_pairs(prompts), stub.model_factory)
+
+    assert [title for _, title in rows] == prompts
+    assert stub.calls > 1
+    # Rows parsed before the cut are not requested again
+    assert stub.prompts_sent < 2 * len(prompts)
+
+
+def test_resume_restores_rows_by_prompt_text(work_dir):
+    run_dir = str(work_dir / "run")
+    checkpoint = RunCheckpoint(run_dir)
+    generate(formatted_pairs(["fox at sea", "cat at sea", "dog at sea"]), StubGemini(latency=0.01).model_factory, checkpoint.stage("metadata"))
+    checkpoint.close()
+
+    # A resumed run formats a prompt that failed before, every later prompt moves one place
+    stub = StubGemini(latency=0.01)
+    checkpoint = RunCheckpoint(run_dir, resume=True)
+    rows = generate(formatted_pairs(["owl at sea", "fox at sea", "cat at sea", "dog at sea"]), stub.model_factory, checkpoint.stage("metadata"))
+    checkpoint.close()
+
+    assert rows == [
+        (f"{FILE_PREFIX}V1-1.jpg", "owl at sea"),
+        (f"{FILE_PREFIX}V1-2.jpg", "fox at sea"),
+        (f"{FILE_PREFIX}V1-3.jpg", "cat at sea"),
+        (f"{FILE_PREFIX}V1-4.jpg", "dog at sea"),
+    ]
+    assert stub.calls == 1
+
+
+def test_run_stops_when_every_key_is_invalid():
+    with pytest.raises(NoUsableKeysError):
+        generate(formatted_pairs(["fox at sea", "cat at sea"]), lambda *args: InvalidKeyModel())
+
+
+def test_failed_run_leaves_the_history_unchanged():
+    with FixtureServer(num_prompts=6, page_delay=0) as server:
+        links = server.prompt_links()
+        with pytest.raises(NoUsableKeysError):
+            FixturePipeline(links, lambda *args: InvalidKeyModel()).run(server.gallery_url, "prompts.csv", 1, 2, FILE_PREFIX, ["key"], 2)
+
+        # Run again from the start, not resumed
+        FixturePipeline(links, StubGemini(latency=0.01).model_factory).run(server.gallery_url, "prompts.csv", 1, 2, FILE_PREFIX, ["key"], 2)
+
+    with open("prompts.csv", newline="", encoding="utf-8") as file:
+        assert len(list(csv.reader(file))) == 1 + 6
+    with open(f"{FILE_PREFIX}-md-V1.csv", newline="", encoding="utf-8") as file:
+        assert len(list(csv.reader(file, delimiter=";"))) == 1 + 6
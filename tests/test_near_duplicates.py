@@ -0,0 +1,140 @@
+import sqlite3
+import time
+
+import pytest
+
+import near_duplicates
+from near_duplicates import NearDuplicateIndex, normalize_prompt
+
+PROMPT = "a red fox sitting in the snow at dawn, highly detailed --ar 16:9"
+NEAR = "A red fox sitting in the snow at dawn, highly detailed, --v 6"
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "history.sqlite")
+
+
+def run_ids(path):
+    connection = sqlite3.connect(path)
+    try:
+        return [run_id for run_id, in connection.execute("SELECT run_id FROM prompts ORDER BY id")]
+    finally:
+        connection.close()
+
+
+def test_normalize_prompt_drops_parameters_and_punctuation():
+    assert normalize_prompt("A Fox, at DAWN! --ar 16:9 --style raw --tile") == "a fox at dawn"
+
+
+def test_near_duplicate_in_the_same_run():
+    index = NearDuplicateIndex()
+
+    assert index.check_and_add(PROMPT) is None
+    similarity, prompt, from_history = index.check_and_add(NEAR)
+
+    assert similarity >= index.threshold
+    assert prompt == PROMPT
+    assert not from_history
+    assert index.check_and_add("a blue whale under the northern lights") is None
+    assert index.added == 2
+
+
+def test_new_prompts_are_tagged_with_the_run_id(path):
+    index = NearDuplicateIndex(path)
+    index.check_and_add(PROMPT)
+
+    assert run_ids(path) == [index.run_id]
+    index.close()
+
+
+def test_committed_prompts_become_history(path):
+    index = NearDuplicateIndex(path)
+    index.check_and_add(PROMPT)
+    index.commit()
+    index.close()
+
+    assert run_ids(path) == [None]
+    index = NearDuplicateIndex(path)
+    assert index.history_size == 1
+    assert index.check_and_add(NEAR)[1:] == (PROMPT, True)
+    index.close()
+
+
+def test_close_without_commit_removes_the_run_prompts(path):
+    index = NearDuplicateIndex(path)
+    index.check_and_add(PROMPT)
+    index.close()
+
+    assert run_ids(path) == []
+    index = NearDuplicateIndex(path)
+    assert index.check_and_add(NEAR) is None
+    index.close()
+
+
+def test_unfinished_runs_do_not_see_each_other(path):
+    first = NearDuplicateIndex(path)
+    second = NearDuplicateIndex(path)
+
+    assert first.check_and_add(PROMPT) is None
+    assert second.check_and_add(NEAR) is None
+    first.close()
+    second.close()
+
+
+def test_prompts_of_a_dead_run_expire(path, monkeypatch):
+    dead = NearDuplicateIndex(path)
+    dead.check_and_add(PROMPT)
+    # The process died, close() never ran
+    dead.connection.close()
+
+    NearDuplicateIndex(path).close()
+    assert run_ids(path) == [dead.run_id]
+
+    later = time.time() + near_duplicates.PENDING_TTL + 60
+    monkeypatch.setattr(near_duplicates.time, "time", lambda: later)
+    index = NearDuplicateIndex(path)
+    assert run_ids(path) == []
+    assert index.check_and_add(NEAR) is None
+    index.close()
+
+
+def test_older_files_get_the_new_columns(path):
+    # Built before prompts were tagged by run, every row is history
+    template = NearDuplicateIndex()
+    template.check_and_add(PROMPT)
+    signature, = template.connection.execute("SELECT signature FROM prompts").fetchone()
+    keys = template.band_keys(template.signature(set(normalize_prompt(PROMPT).split())))
+    settings = list(template.connection.execute("SELECT name, value FROM settings"))
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    connection.execute("CREATE TABLE prompts (id INTEGER PRIMARY KEY, prompt TEXT NOT NULL, signature BLOB NOT NULL)")
+    connection.execute("CREATE TABLE bands (band_key INTEGER NOT NULL, prompt_id INTEGER NOT NULL)")
+    connection.executemany("INSERT INTO settings VALUES (?, ?)", settings)
+    connection.execute("INSERT INTO prompts (id, prompt, signature) VALUES (1, ?, ?)", (PROMPT, signature))
+    connection.executemany("INSERT INTO bands VALUES (?, 1)", [(key,) for key in keys])
+    connection.commit()
+    connection.close()
+
+    index = NearDuplicateIndex(path)
+
+    assert index.history_size == 1
+    assert index.check_and_add(NEAR)[1:] == (PROMPT, True)
+    index.close()
+    assert run_ids(path) == [None]
+
+
+def test_other_minhash_settings_are_rejected(path):
+    NearDuplicateIndex(path).close()
+
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(path, num_perm=32)
+
+
+@pytest.mark.parametrize("prompt", ["🦊🌅", "--ar 16:9 --v 6", "!!! ..."])
+def test_prompts_without_words_are_not_indexed(prompt):
+    index = NearDuplicateIndex()
+
+    assert index.check_and_add(prompt) is None
+    assert index.check_and_add("🐳🌌 --ar 1:1") is None
+    assert index.added == 0
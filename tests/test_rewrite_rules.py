@@ -0,0 +1,63 @@
+import pytest
+
+from rewrite_rules import RewriteRules, DEFAULT_RULES
+
+RULES = [
+    {"name": "version", "parameter": "v", "value_pattern": r"\d+(?:\.\d+)?", "set": "6.1"},
+    {"name": "no style", "parameter": "style", "remove": True},
+    {"name": "banned terms", "terms": ["trending on artstation", "unreal engine"]},
+    {"name": "brand", "terms": ["midjourney"], "replace": "AI"},
+]
+
+
+@pytest.fixture
+def rules():
+    return RewriteRules(RULES)
+
+
+@pytest.mark.parametrize("prompt, expected", [
+    ("a cat --v 5.2", "a cat --v 6.1"),
+    ("a cat --ar 16:9 --style raw", "a cat --ar 16:9"),
+    ("a cat --style raw --v 6", "a cat --v 6.1"),
+    ("a, trending on artstation, b", "a, b"),
+    ("a cat, Trending  on ArtStation", "a cat"),
+    ("unreal engine, a cat", "a cat"),
+    ("Midjourney art, midjourneyish", "AI art, midjourneyish"),
+])
+def test_rewrite(rules, prompt, expected):
+    assert rules.rewrite(prompt)[0] == expected
+
+
+def test_changes_name_the_rule_and_the_text(rules):
+    assert rules.rewrite("a cat --style raw --v 6") == ("a cat --v 6.1", [
+        ("no style", "--style raw", ""),
+        ("version", "--v 6", "--v 6.1"),
+    ])
+
+
+def test_prompt_without_matches_is_unchanged(rules):
+    assert rules.rewrite("a cat --v 6.1") == ("a cat --v 6.1", [])
+
+
+def test_hits_are_counted_per_rule(rules):
+    for prompt in ["a --v 5", "b --v 5.2", "c, unreal engine"]:
+        rules.rewrite(prompt)
+
+    assert rules.stats_lines() == [
+        "Rewrite rule 'version': 2 rewrites",
+        "Rewrite rule 'no style': 0 rewrites",
+        "Rewrite rule 'banned terms': 1 rewrites",
+        "Rewrite rule 'brand': 0 rewrites",
+    ]
+
+
+def test_missing_rules_file_uses_the_defaults(tmp_path):
+    rules = RewriteRules.load(str(tmp_path / "missing.json"))
+
+    assert rules.rules == [rule["name"] for rule in DEFAULT_RULES]
+    assert rules.rewrite("a cat --v 5")[0] == "a cat --v 6.1"
+
+
+def test_rule_without_an_action_is_rejected():
+    with pytest.raises(ValueError):
+        RewriteRules([{"name": "broken", "parameter": "ar"}])
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import pytest
+
+from structured_output import JsonRecordParser, stream_records
+
+RECORDS = [
+    {"id": 1, "prompt": 'a "quoted" word and a {brace}'},
+    {"id": 2, "prompt": "a back\\slash, a newline\n and unicode é"},
+    {"id": 3, "prompt": "nested", "keywords": ["a", "b"], "extra": {"depth": {"more": 1}}},
+]
+
+
+def feed_in_chunks(parser, text, size):
+    records = []
+    for start in range(0, len(text), size):
+        records.extend(parser.feed(text[start:start + size]))
+    return records
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 64, 100000])
+def test_array_split_at_any_chunk_boundary(size):
+    parser = JsonRecordParser()
+
+    assert feed_in_chunks(parser, json.dumps(RECORDS), size) == RECORDS
+    assert parser.records == 3
+    assert parser.errors == 0
+    assert not parser.incomplete
+
+
+def test_json_lines_in_a_code_fence():
+    text = "Here you go:\n```json\n" + "\n".join(json.dumps(record) for record in RECORDS) + "\n```\n"
+
+    assert feed_in_chunks(JsonRecordParser(), text, 7) == RECORDS
+
+
+def test_records_are_returned_as_soon_as_they_are_complete():
+    parser = JsonRecordParser()
+    text = json.dumps(RECORDS)
+    end_of_first = text.index("}, {") + 1
+
+    assert parser.feed(text[:end_of_first]) == RECORDS[:1]
+    assert parser.feed(text[end_of_first:]) == RECORDS[1:]
+
+
+def test_invalid_object_is_counted_and_skipped():
+    parser = JsonRecordParser()
+    text = '[{"id": 1, "prompt": "a"}, {"id": 2 "prompt": "b"}, {"id": 3, "prompt": "c"}]'
+
+    assert [record["id"] for record in parser.feed(text)] == [1, 3]
+    assert parser.errors == 1
+    assert parser.records == 2
+
+
+def test_wrapper_object_is_unwrapped():
+    parser = JsonRecordParser()
+
+    assert parser.feed(json.dumps({"results": RECORDS})) == RECORDS
+    assert parser.records == 3
+
+
+def test_cut_off_response_keeps_the_complete_records():
+    parser = JsonRecordParser()
+    text = json.dumps(RECORDS)
+
+    assert parser.feed(text[:-10]) == RECORDS[:2]
+    assert parser.incomplete
+
+
+def test_stream_records_collects_the_raw_chunks():
+    text = json.dumps(RECORDS)
+    chunks = [text[start:start + 10] for start in range(0, len(text), 10)]
+
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect(raw):
+        return [record async for record in stream_records(source(), JsonRecordParser(), raw)]
+
+    raw = []
+    assert asyncio.run(collect(raw)) == RECORDS
+    assert raw == chunks